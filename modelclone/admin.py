@@ -1,33 +1,166 @@
+import cProfile
+import csv
+import io
+import json
+import logging
+import os
+import random
+import re
+import time
+from contextlib import contextmanager
+from functools import partial
+
 from django import VERSION
 from django.contrib.admin import ModelAdmin, helpers
+from django.contrib.admin.widgets import (
+    ForeignKeyRawIdWidget, ManyToManyRawIdWidget, RelatedFieldWidgetWrapper,
+)
+try:
+    from django.contrib.admin.widgets import AutocompleteSelect, AutocompleteSelectMultiple
+except ImportError:
+    # django < 2.0
+    AutocompleteSelect = AutocompleteSelectMultiple = None
 try:
-    from django.contrib.admin.utils import unquote
+    from django.contrib.admin.utils import flatten_fieldsets, unquote
 except ImportError:
     # django < 1.7
-    from django.contrib.admin.util import unquote
+    from django.contrib.admin.util import flatten_fieldsets, unquote
 from django.conf.urls import url
 from django.utils.encoding import force_text
 from django.utils.translation import ugettext as _
 from django.utils.translation import ugettext_lazy as lazy
 from django.utils.html import escape
+from django.utils.crypto import get_random_string
+from django.utils.http import urlencode
 from django.forms.models import model_to_dict
 from django.forms.formsets import all_valid
 if VERSION[0] < 2:
     from django.core.urlresolvers import reverse
 else:
     from django.urls import reverse
-from django.core.exceptions import PermissionDenied
-from django.http import Http404
+from django.core.exceptions import (
+    NON_FIELD_ERRORS, FieldDoesNotExist, PermissionDenied, ValidationError)
+from django.conf import settings
+from django.core.cache import caches
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse
+from django.template.response import TemplateResponse
+from django.db import connections, router, transaction
+from django.db.models import (
+    Case, CharField, Count, F, IntegerField, Q, SlugField, Sum, Value, When)
 from django.db.models.fields.files import FieldFile, FileField
+from django.db.models.signals import pre_delete
+try:
+    from django.db.models import Subquery
+except ImportError:
+    # django < 1.11
+    Subquery = None
 
+from .signals import buffered_signals, query_budget_exceeded
 
-__all__ = 'ClonableModelAdmin',
+
+__all__ = 'ClonableModelAdmin', 'QueryBudgetExceeded'
+
+logger = logging.getLogger('modelclone')
+
+CLONE_PENDING = 'pending'
+CLONE_FORM = 'form'
+CLONE_BULK = 'bulk'
+CLONE_DEFERRED = 'deferred'
+ADMISSION_KEY = 'modelclone:admission'
 
 class ClonableModelAdmin(ModelAdmin):
 
     clone_verbose_name = lazy('Duplicate')
+    clone_many_verbose_name = lazy('Duplicate many')
+    clone_many_template = 'modelclone/clone_many.html'
     change_form_template = 'modelclone/change_form.html'
 
+    # Inlines, by prefix (e.g. ``'comment_set'``), that are not rendered on the
+    # clone page and are instead copied on save, ``clone_chunk_size`` rows at a time
+    clone_streamed_inlines = ()
+    clone_chunk_size = 500
+
+    # Inlines, by prefix, whose rows are shared with the original object until
+    # the clone is edited, see ``modelclone.models.VirtualRelation``
+    clone_virtual_inlines = ()
+
+    # Fields not loaded or displayed on the clone page. Deferred fields are
+    # copied from the original object on save with an UPDATE; excluded fields
+    # are left with their default value
+    clone_defer_fields = ()
+    clone_exclude_fields = ()
+
+    # Give unique text fields a free value on the clone page, like "title (2)"
+    clone_deduplicate_unique_fields = True
+
+    # Record each clone and its original in ``modelclone.models.CloneLineage``
+    clone_record_lineage = False
+
+    # Inlines, by prefix, the clone links ask for. ``None`` means all of them
+    clone_link_inlines = None
+
+    # Database alias, like a read replica, for the reads of the clone page.
+    # The save also reads the original object from there, unless
+    # ``clone_read_source_from_primary`` is set
+    clone_read_database = None
+    clone_read_source_from_primary = False
+
+    # Seconds the clone form token is remembered, so a form submitted twice
+    # creates a single object. ``None`` turns this off
+    clone_idempotency_timeout = 60 * 60
+    clone_idempotency_cache = 'default'
+    # Seconds a repeated submission waits for the first one to finish
+    clone_idempotency_wait = 10
+
+    # Admission control: the total weight of the clones running at once, all
+    # models and processes sharing ``clone_admission_cache`` together. A clone
+    # weighs 1 plus the number of inline rows copied. ``None`` turns this off
+    clone_max_concurrent_weight = None
+    clone_admission_cache = 'default'
+    # Seconds a clone over the limit waits for room before getting a 503
+    clone_admission_wait = 0
+    # Seconds without any clone starting or finishing after which the total is
+    # forgotten, along with the weight left by crashed processes
+    clone_admission_timeout = 5 * 60
+
+    # Render the relation fields of the clone page with autocomplete widgets, or
+    # raw id widgets when the related admin has no ``search_fields``, so only
+    # their current values are loaded, whatever the size of the related table
+    clone_lightweight_relations = False
+
+    # Hold back ``pre_save``, ``post_save`` and ``m2m_changed`` of the objects saved
+    # by a clone, and send ``modelclone.signals.objects_cloned`` once per model
+    # with the primary keys created instead
+    clone_buffer_signals = False
+
+    # Profile this fraction of the clone pages with cProfile, saving the profiles
+    # in ``clone_profile_dir``. The oldest profiles are removed when the directory
+    # gets bigger than ``clone_profile_max_bytes``
+    clone_profile_rate = 0
+    clone_profile_dir = None
+    clone_profile_max_bytes = 100 * 1024 * 1024
+
+    # Maximum number of queries of the clone page, by request method, like
+    # ``{'GET': 20, 'POST': 50}``. Going over is logged, sent as
+    # ``modelclone.signals.query_budget_exceeded`` and, if
+    # ``clone_query_budget_raise`` is set (``settings.DEBUG`` by default), raised
+    clone_query_budget = {}
+    clone_query_budget_raise = None
+
+    # Rows copied (the object, inline rows and many-to-many links) above which the
+    # clone page leaves out the inlines and copies them in bulk on save, and above
+    # which the save is handed to ``save_deferred_clone()``. ``None`` turns them off
+    clone_bulk_threshold = None
+    clone_deferred_threshold = None
+    # Integer fields holding the size of file fields, like ``{'image': 'image_size'}``,
+    # so the cost estimate can add up file bytes
+    clone_file_size_fields = {}
+
+    def __init__(self, model, admin_site):
+        super(ClonableModelAdmin, self).__init__(model, admin_site)
+        if self.clone_virtual_inlines:
+            self.watch_virtual_deletes()
+
     def clone_link(self, clonable_model):
         '''
         Method to be used on `list_display`, renders a link to clone model
@@ -39,7 +172,8 @@ class ClonableModelAdmin(ModelAdmin):
             args=(clonable_model._get_pk_val(),),
             current_app=self.admin_site.name
         )
-        return '<a href="{0}">{1}</a>'.format(_url, self.clone_verbose_name)
+        return '<a href="{0}{1}">{2}</a>'.format(_url, self.get_clone_link_query(),
+                                                 self.clone_verbose_name)
 
     clone_link.short_description = clone_verbose_name  # not overridable by subclass
     clone_link.allow_tags = True
@@ -52,12 +186,24 @@ class ClonableModelAdmin(ModelAdmin):
         if VERSION[0] == 1 and VERSION[1] < 9:
             from django.conf.urls import patterns
             new_urlpatterns = patterns('',
+                url(r'^(.+)/clone/many/$',
+                    self.admin_site.admin_view(self.clone_many_view),
+                    name=url_name + '_many'),
+                url(r'^(.+)/clone/estimate/$',
+                    self.admin_site.admin_view(self.clone_estimate_view),
+                    name=url_name + '_estimate'),
                 url(r'^(.+)/clone/$',
                     self.admin_site.admin_view(self.clone_view),
                     name=url_name)
                 )
         else:
             new_urlpatterns = [
+                url(r'^(.+)/change/clone/many/$',
+                    self.admin_site.admin_view(self.clone_many_view),
+                    name=url_name + '_many'),
+                url(r'^(.+)/change/clone/estimate/$',
+                    self.admin_site.admin_view(self.clone_estimate_view),
+                    name=url_name + '_estimate'),
                 url(r'^(.+)/change/clone/$',
                     self.admin_site.admin_view(self.clone_view),
                     name=url_name)
@@ -71,28 +217,122 @@ class ClonableModelAdmin(ModelAdmin):
         extra_context = extra_context or {}
         extra_context.update({
             'clone_verbose_name': self.clone_verbose_name,
+            'clone_many_verbose_name': self.clone_many_verbose_name,
+            'clone_link_query': self.get_clone_link_query(),
             'include_clone_link': True,
         })
         return super(ClonableModelAdmin, self).change_view(request, object_id, form_url, extra_context)
 
+    def get_formsets_with_inlines(self, request, obj=None):
+        relations = {}
+        if obj is not None and self.clone_virtual_inlines:
+            from .models import VirtualRelation
+            relations = dict(((relation.related_content_type_id, relation.fk_name), relation)
+                             for relation in VirtualRelation.objects.of(obj))
+
+        for FormSet, inline in super(ClonableModelAdmin, self).get_formsets_with_inlines(
+                request, obj):
+            if relations and not hasattr(FormSet, 'ct_fk_field'):
+                from django.contrib.contenttypes.models import ContentType
+                content_type = ContentType.objects.get_for_model(FormSet.model)
+                relation = relations.get((content_type.pk, FormSet.fk.name))
+                if relation is not None:
+                    FormSet = virtual_formset(FormSet, relation.source_rows())
+            yield FormSet, inline
+
+    def save_model(self, request, obj, form, change):
+        if change and self.clone_virtual_inlines:
+            # the rows of obj may change, its virtual clones need their own
+            self.materialize_virtual_clones(obj)
+        super(ClonableModelAdmin, self).save_model(request, obj, form, change)
+
+    def save_related(self, request, form, formsets, change):
+        super(ClonableModelAdmin, self).save_related(request, form, formsets, change)
+        if change and self.clone_virtual_inlines:
+            self.materialize_virtual_inlines(form.instance, formsets)
+
     def clone_view(self, request, object_id, form_url='', extra_context=None):
-        opts = self.model._meta
+        budget = None
+        if self.clone_query_budget:
+            budget = self.clone_query_budget.get(request.method)
+        if budget is None or QueryCounter is None:
+            return self.budgeted_clone_view(request, object_id, form_url, extra_context)
+
+        with QueryCounter() as counter:
+            response = self.budgeted_clone_view(request, object_id, form_url, extra_context)
+        self.check_clone_query_budget(request, object_id, counter.count, budget)
+        return response
 
+    def budgeted_clone_view(self, request, object_id, form_url='', extra_context=None):
         if not self.has_add_permission(request):
             raise PermissionDenied
 
-        original_obj = self.get_object(request, unquote(object_id))
+        original_obj = self.get_clone_object(request, unquote(object_id))
 
         if original_obj is None:
-            raise Http404(_('{name} object with primary key {key} does not exist.'.format(
-                name=force_text(opts.verbose_name),
-                key=repr(escape(object_id))
-            )))
+            raise self.clone_object_not_found(object_id)
+
+        token_key = None
+        if request.method == 'POST':
+            token_key = self.get_clone_token_key(request)
+            if token_key is not None:
+                # a repeated submission is answered from the first one, before
+                # taking any room from the clones actually running
+                response = self.claim_clone_token(request, token_key)
+                if response is not None:
+                    return response
+
+        saved_objects = []
+        estimate = None
+        if (self.clone_max_concurrent_weight is not None or
+                self.clone_bulk_threshold is not None or
+                self.clone_deferred_threshold is not None):
+            # both the admission weight and the page strategy come from it
+            estimate = self.estimate_clone_cost(request, original_obj)
+
+        def clone():
+            response = self.clone_changeform_view(request, original_obj, form_url, extra_context,
+                                                  saved_objects, estimate)
+            if hasattr(response, 'render'):
+                # the clone page queries choices while rendering
+                response.render()
+            return response
+
+        try:
+            weight = self.get_clone_weight(request, original_obj, estimate)
+            if not self.acquire_clone_admission(weight):
+                return self.clone_busy_response(request)
+            try:
+                return self.profile_clone(request, original_obj, clone)
+            finally:
+                self.release_clone_admission(weight)
+        finally:
+            if token_key is not None:
+                # only a committed clone keeps the token, any other exit frees it
+                self.release_clone_token(token_key, saved_objects[0] if saved_objects else None)
 
-        ModelForm = self.get_form(request)
+    def clone_changeform_view(self, request, original_obj, form_url='', extra_context=None,
+                              saved_objects=None, estimate=None):
+        '''
+        Renders the clone page of ``original_obj``, or saves the clone it submitted,
+        appending it to the list ``saved_objects`` if given. ``estimate`` is its
+        ``estimate_clone_cost()``, if already known.
+        '''
+        opts = self.model._meta
+        fieldsets = self.get_clone_fieldsets(request)
+        form_kwargs = {'fields': flatten_fieldsets(fieldsets)}
+        if self.clone_lightweight_relations:
+            form_kwargs['formfield_callback'] = partial(self.formfield_for_clone_dbfield,
+                                                        request=request)
+        ModelForm = self.get_form(request, **form_kwargs)
         formsets = []
+        inline_instances = []
+        streamed = []
+        strategy = self.get_clone_page_strategy(request, original_obj, estimate)
 
         if request.method == 'POST':
+            clone_token = request.POST.get('_clone_token')
+
             form = ModelForm(request.POST, request.FILES)
             if form.is_valid():
                 new_object = self.save_form(request, form, change=False)
@@ -101,21 +341,21 @@ class ClonableModelAdmin(ModelAdmin):
                 new_object = self.model()
                 form_validated = False
 
-            prefixes = {}
-            for FormSet, inline in self.get_formsets_with_inlines(request):
-                prefix = FormSet.get_default_prefix()
-                prefixes[prefix] = prefixes.get(prefix, 0) + 1
-                if prefixes[prefix] != 1 or not prefix:
-                    prefix = "%s-%s" % (prefix, prefixes[prefix])
+            for FormSet, inline, prefix in self.get_cloned_formsets_with_inlines(request):
+                if self.is_streamed_inline(prefix, strategy):
+                    streamed.append((FormSet, inline, prefix))
+                    continue
 
                 request_files = request.FILES
-                filter_params = {'%s__pk' % original_obj.__class__.__name__.lower(): original_obj.pk}
-                inlined_objs = inline.model.objects.filter(**filter_params)
-                for n, inlined_obj in enumerate(inlined_objs.all()):
-                    for field in inlined_obj._meta.fields:
-                        if isinstance(field, FileField) and field not in request_files:
-                            value = field.value_from_object(inlined_obj)
-                            file_field_name = '{}-{}-{}'.format(prefix, n, field.name)
+                file_fields = [field.name for field in inline.model._meta.fields
+                               if isinstance(field, FileField)]
+                if file_fields:
+                    queryset = self.get_cloned_inline_queryset(
+                        request, inline, FormSet, prefix, original_obj).only(*file_fields)
+                    for n, inlined_obj in enumerate(_iterator(queryset, self.clone_chunk_size)):
+                        for name in file_fields:
+                            value = getattr(inlined_obj, name)
+                            file_field_name = '{}-{}-{}'.format(prefix, n, name)
                             request_files.setdefault(file_field_name, value)
 
                 formset = FormSet(data=request.POST, files=request_files,
@@ -123,45 +363,40 @@ class ClonableModelAdmin(ModelAdmin):
                                   save_as_new="_saveasnew" in request.POST,   # ????
                                   prefix=prefix)
                 formsets.append(formset)
+                inline_instances.append(inline)
 
             if all_valid(formsets) and form_validated:
-
-                # if original model has any file field, save new model
-                # with same paths to these files
-                for name in vars(original_obj):
-                    field = getattr(original_obj, name)
-                    if isinstance(field, FieldFile) and name not in request.FILES:
-                        setattr(new_object, name, field)
-
-                self.save_model(request, new_object, form, False)
-                self.save_related(request, form, formsets, False)
-                try:
-                    self.log_addition(request, new_object)
-                except TypeError:
-                    # In Django 1.9 we need one more param
-                    self.log_addition(request, new_object, "Cloned object")
-
+                if strategy == CLONE_DEFERRED:
+                    self.save_deferred_clone(request, original_obj, new_object, form,
+                                             formsets, streamed)
+                else:
+                    self.save_clone(request, original_obj, new_object, form, formsets,
+                                    streamed)
+                if saved_objects is not None:
+                    saved_objects.append(new_object)
                 return self.response_add(request, new_object, None)
 
         else:
-            initial = model_to_dict(original_obj)
+            clone_token = self.get_new_clone_token()
+            using = self.get_clone_read_database(request)
+            read_choices_from(ModelForm, using)
+            initial = model_to_dict(original_obj, exclude=self.get_clone_omitted_fields())
+            initial.update(self.get_unique_clone_values(initial, using=using)[0])
             initial = self.tweak_cloned_fields(initial)
             form = ModelForm(initial=initial)
 
-            prefixes = {}
-            for FormSet, inline in self.get_formsets_with_inlines(request):
-                prefix = FormSet.get_default_prefix()
-                prefixes[prefix] = prefixes.get(prefix, 0) + 1
-                if prefixes[prefix] != 1 or not prefix:
-                    prefix = "%s-%s" % (prefix, prefixes[prefix])
+            for FormSet, inline, prefix in self.get_cloned_formsets_with_inlines(request):
+                if self.is_streamed_inline(prefix, strategy):
+                    continue
                 initial = []
 
-                queryset = inline.get_queryset(request).filter(
-                    **{FormSet.fk.name: original_obj})
-                for obj in queryset:
-                    initial.append(model_to_dict(obj, exclude=[obj._meta.pk.name,
-                                                               FormSet.fk.name]))
+                queryset = self.get_cloned_inline_queryset(
+                    request, inline, FormSet, prefix, original_obj)
+                exclude = [queryset.model._meta.pk.name] + inline_parent_fields(FormSet)
+                for obj in _iterator(queryset, self.clone_chunk_size):
+                    initial.append(model_to_dict(obj, exclude=exclude))
                 initial = self.tweak_cloned_inline_fields(prefix, initial)
+                read_choices_from(FormSet.form, using)
                 formset = FormSet(prefix=prefix, initial=initial)
                 # Since there is no way to customize the `extra` in the constructor,
                 # construct the forms again...
@@ -172,10 +407,11 @@ class ClonableModelAdmin(ModelAdmin):
                 if hasattr(formset, '_construct_forms'):
                     formset._construct_forms()
                 formsets.append(formset)
+                inline_instances.append(inline)
 
         admin_form = helpers.AdminForm(
             form,
-            list(self.get_fieldsets(request)),
+            fieldsets,
             self.get_prepopulated_fields(request),
             self.get_readonly_fields(request),
             model_admin=self
@@ -183,7 +419,7 @@ class ClonableModelAdmin(ModelAdmin):
         media = self.media + admin_form.media
 
         inline_admin_formsets = []
-        for inline, formset in zip(self.get_inline_instances(request), formsets):
+        for inline, formset in zip(inline_instances, formsets):
             fieldsets = list(inline.get_fieldsets(request, original_obj))
             readonly = list(inline.get_readonly_fields(request, original_obj))
             prepopulated = dict(inline.get_prepopulated_fields(request, original_obj))
@@ -203,6 +439,8 @@ class ClonableModelAdmin(ModelAdmin):
             'show_delete': False,
             'media': media,
             'inline_admin_formsets': inline_admin_formsets,
+            'clone_token': clone_token,
+            'clone_strategy': strategy,
             'errors': helpers.AdminErrorList(form, formsets),
             'app_label': opts.app_label,
         }
@@ -214,6 +452,863 @@ class ClonableModelAdmin(ModelAdmin):
             change=False
         )
 
+    def save_clone(self, request, original_obj, new_object, form, formsets, streamed):
+        '''
+        Saves the validated ``new_object`` cloned from ``original_obj``, with its inlines
+
+        Everything is saved in a single transaction, so either the whole clone is
+        created or nothing is.
+        '''
+        # if original model has any file field, save new model
+        # with same paths to these files
+        for name in vars(original_obj):
+            field = getattr(original_obj, name)
+            if isinstance(field, FieldFile) and name not in request.FILES:
+                setattr(new_object, name, field)
+
+        models = [self.model] + [formset.model for formset in formsets]
+        models += [FormSet.model for FormSet, inline, prefix in streamed]
+        using = router.db_for_write(self.model)
+        with self.buffer_clone_signals(models) as signals, transaction.atomic(using=using):
+            self.save_model(request, new_object, form, False)
+            self.copy_deferred_fields(original_obj, new_object)
+            self.save_related(request, form, formsets, False)
+            for FormSet, inline, prefix in streamed:
+                if self.is_virtual_inline(FormSet, prefix):
+                    self.record_virtual_inline(original_obj, [new_object], FormSet)
+                    continue
+                queryset = self.get_cloned_inline_queryset(
+                    request, inline, FormSet, prefix, original_obj)
+                pks = self.clone_streamed_inline(
+                    request, queryset, inline_parent_fields(FormSet)[-1], new_object)
+                add_created(signals, FormSet.model, pks)
+            self.record_lineage(original_obj, [new_object])
+            self.log_clone(request, new_object)
+
+    def save_deferred_clone(self, request, original_obj, new_object, form, formsets, streamed):
+        '''
+        Saves a clone too big for ``save_clone()`` to run during the request
+
+        Override this to copy the ``streamed`` inlines in a background job, after
+        saving ``new_object`` with ``save_clone(..., streamed=[])``. By default the
+        clone is saved right away, like a bulk one.
+        '''
+        self.save_clone(request, original_obj, new_object, form, formsets, streamed)
+
+    def buffer_clone_signals(self, models):
+        '''
+        Returns a context manager holding back per-row signals of ``models``, see
+        ``clone_buffer_signals``
+        '''
+        if not self.clone_buffer_signals:
+            return _no_buffer()
+        return buffered_signals(models)
+
+    def check_clone_query_budget(self, request, object_id, count, budget):
+        '''
+        Reports a clone page that ran ``count`` queries, if that's over ``budget``
+        '''
+        if count <= budget:
+            return
+
+        opts = self.model._meta
+        message = '{0} {1}.{2} {3} ran {4} queries, over the budget of {5}'.format(
+            request.method, opts.app_label,
+            getattr(opts, 'module_name', getattr(opts, 'model_name', '')),
+            object_id, count, budget)
+        logger.warning(message)
+        query_budget_exceeded.send(sender=self.model, model_admin=self, request=request,
+                                   object_id=object_id, queries=count, budget=budget)
+
+        should_raise = self.clone_query_budget_raise
+        if should_raise is None:
+            should_raise = settings.DEBUG
+        if should_raise:
+            raise QueryBudgetExceeded(message)
+
+    def profile_clone(self, request, original_obj, clone):
+        '''
+        Calls ``clone()``, under cProfile for a sample of ``clone_profile_rate`` of the calls
+        '''
+        if not self.clone_profile_dir or random.random() >= self.clone_profile_rate:
+            return clone()
+
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(clone)
+        finally:
+            try:
+                self.save_clone_profile(profiler, original_obj, request.method.lower())
+            except Exception:
+                # profiling is optional, it must not fail the clone
+                logger.exception('Could not save the clone profile in %s',
+                                 self.clone_profile_dir)
+
+    def save_clone_profile(self, profiler, original_obj, phase):
+        """Saves a profile of cloning ``original_obj`` in ``clone_profile_dir``.
+
+        The file is named after the model, the primary key and the phase (``get`` or
+        ``post``), like ``posts.post-42-get-1546300800000000.prof``, and can be read
+        with ``pstats`` or tools like snakeviz.
+        """
+        opts = self.model._meta
+        directory = self.clone_profile_dir
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # already exists
+            pass
+
+        filename = '{0}.{1}-{2}-{3}-{4}.prof'.format(
+            opts.app_label, getattr(opts, 'module_name', getattr(opts, 'model_name', '')),
+            re.sub(r'[^\w.-]', '_', force_text(original_obj.pk)), phase,
+            int(time.time() * 1000000))
+        path = os.path.join(directory, filename)
+        profiler.dump_stats(path)
+
+        # rotate, keeping at least the profile just saved
+        profiles = []
+        for name in os.listdir(directory):
+            if name.endswith('.prof') and name != filename:
+                try:
+                    stat = os.stat(os.path.join(directory, name))
+                except OSError:
+                    # removed by another process
+                    continue
+                profiles.append((stat.st_mtime, name, stat.st_size))
+        total = os.path.getsize(path) + sum(size for mtime, name, size in profiles)
+        for mtime, name, size in sorted(profiles):
+            if total <= self.clone_profile_max_bytes:
+                break
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                # removed by another process
+                pass
+            total -= size
+
+    def get_clone_weight(self, request, original_obj, estimate=None):
+        '''
+        Returns how heavy cloning ``original_obj`` is, for admission control:
+        the rows it inserts, from its ``estimate_clone_cost()`` if given
+        '''
+        if self.clone_max_concurrent_weight is None:
+            return 0
+        if estimate is None:
+            estimate = self.estimate_clone_cost(request, original_obj)
+        return estimate['rows']
+
+    def acquire_clone_admission(self, weight):
+        """Reserves ``weight`` out of ``clone_max_concurrent_weight`` for a clone.
+
+        Waits up to ``clone_admission_wait`` seconds for other clones to finish.
+        Returns ``False`` if there's no room. A clone heavier than the limit is let in
+        when no other clone is running.
+        """
+        limit = self.clone_max_concurrent_weight
+        if limit is None:
+            return True
+        weight = min(weight, limit)
+        cache = caches[self.clone_admission_cache]
+        deadline = time.time() + self.clone_admission_wait
+        while True:
+            cache.add(ADMISSION_KEY, 0, self.clone_admission_timeout)
+            try:
+                total = cache.incr(ADMISSION_KEY, weight)
+            except ValueError:
+                # expired between add() and incr()
+                continue
+            if total <= limit:
+                touch(cache, ADMISSION_KEY, self.clone_admission_timeout)
+                return True
+            cache.decr(ADMISSION_KEY, weight)
+            touch(cache, ADMISSION_KEY, self.clone_admission_timeout)
+            if time.time() >= deadline:
+                return False
+            time.sleep(0.1)
+
+    def release_clone_admission(self, weight):
+        limit = self.clone_max_concurrent_weight
+        if limit is None:
+            return
+        cache = caches[self.clone_admission_cache]
+        try:
+            total = cache.decr(ADMISSION_KEY, min(weight, limit))
+        except ValueError:
+            # expired while cloning
+            return
+        if total < 0:
+            # expired while cloning and started again without this clone's weight
+            cache.incr(ADMISSION_KEY, -total)
+        touch(cache, ADMISSION_KEY, self.clone_admission_timeout)
+
+    def clone_busy_response(self, request):
+        response = HttpResponse(
+            _('Too many objects are being cloned right now, please retry in a moment.'),
+            status=503)
+        response['Retry-After'] = '5'
+        return response
+
+    def get_new_clone_token(self):
+        if self.clone_idempotency_timeout is None:
+            return None
+        return get_random_string(32)
+
+    def get_clone_token_key(self, request):
+        '''
+        Returns the cache key for the token the clone form was submitted with, if any
+        '''
+        if self.clone_idempotency_timeout is None:
+            return None
+        token = request.POST.get('_clone_token', '')
+        if not re.match(r'^[A-Za-z0-9]{1,64}$', token):
+            return None
+        opts = self.model._meta
+        return 'modelclone:{0}.{1}:{2}'.format(
+            opts.app_label, getattr(opts, 'module_name', getattr(opts, 'model_name', '')), token)
+
+    def claim_clone_token(self, request, token_key):
+        """Claims the token of a clone form submission.
+
+        Returns ``None`` if this is the first submission with the token. Otherwise,
+        returns ``response_add()`` for the object the first submission created, waiting
+        up to ``clone_idempotency_wait`` seconds for it to finish, or a 409 response if
+        it's still running.
+        """
+        cache = caches[self.clone_idempotency_cache]
+        deadline = time.time() + self.clone_idempotency_wait
+        while not cache.add(token_key, CLONE_PENDING, self.clone_idempotency_timeout):
+            pk = cache.get(token_key)
+            if pk == CLONE_PENDING:
+                if time.time() >= deadline:
+                    return HttpResponse(_('This object is already being cloned.'), status=409)
+                time.sleep(0.1)
+            elif pk is None:
+                # expired, or left without a value: the token is free
+                cache.delete(token_key)
+            else:
+                new_object = self.model._default_manager.filter(pk=pk).first()
+                if new_object is not None:
+                    return self.response_add(request, new_object, None)
+                # the clone was deleted since, make a new one
+                cache.delete(token_key)
+        return None
+
+    def release_clone_token(self, token_key, new_object):
+        '''
+        Records the object created with a token, or frees the token if nothing was created
+        '''
+        cache = caches[self.clone_idempotency_cache]
+        if new_object is None:
+            cache.delete(token_key)
+        else:
+            cache.set(token_key, new_object.pk, self.clone_idempotency_timeout)
+
+    def clone_many_view(self, request, object_id, extra_context=None):
+        '''
+        Creates many copies of an object at once, from an uploaded table of overrides
+
+        The table is a CSV file, with a header line of field names, or a JSON list
+        of objects. Each row is one copy; empty CSV cells keep the original value.
+        '''
+        opts = self.model._meta
+
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+
+        original_obj = self.get_object(request, unquote(object_id))
+
+        if original_obj is None:
+            raise self.clone_object_not_found(object_id)
+
+        error = None
+        if request.method == 'POST':
+            try:
+                variations = parse_variations(request.FILES.get('variations') or
+                                              request.POST.get('variations', ''))
+                weight = self.get_clone_weight(request, original_obj) * len(variations)
+                if not self.acquire_clone_admission(weight):
+                    return self.clone_busy_response(request)
+                try:
+                    new_objects = self.clone_many(request, original_obj, variations)
+                finally:
+                    self.release_clone_admission(weight)
+            except (ValueError, ValidationError, csv.Error) as e:
+                error = u'; '.join(getattr(e, 'messages', None) or [force_text(e)])
+            else:
+                self.message_user(request, _('{count} {name} were created.').format(
+                    count=len(new_objects),
+                    name=force_text(opts.verbose_name_plural)))
+                return HttpResponseRedirect(reverse(
+                    'admin:{0}_{1}_changelist'.format(
+                        opts.app_label, getattr(opts, 'module_name', getattr(opts, 'model_name', ''))),
+                    current_app=self.admin_site.name))
+
+        title = u'{0} {1}'.format(self.clone_many_verbose_name, opts.verbose_name)
+
+        context = dict(
+            self.admin_site.each_context(request),
+            title=title,
+            opts=opts,
+            app_label=opts.app_label,
+            original=original_obj,
+            error=error,
+        )
+        context.update(extra_context or {})
+
+        return TemplateResponse(request, self.clone_many_template, context)
+
+    def clone_many(self, request, original_obj, variations):
+        '''
+        Creates one copy of ``original_obj``, with its inlines and many-to-many
+        relations, for each dictionary of field overrides in ``variations``
+
+        Everything runs in a single transaction. The copies share bulk inserts for
+        the inline rows and many-to-many links, which don't call ``save()`` or send
+        model signals. The objects themselves are inserted in bulk too when the
+        database can return the new primary keys, like PostgreSQL, and the model has
+        no multi-table parents. Otherwise, like on SQLite and MySQL, each one is saved
+        with ``save(force_insert=True)``, which sends ``pre_save`` and ``post_save``.
+        The ``tweak_cloned_*`` methods are never called, but each copy is validated
+        with ``full_clean()``. Fields omitted on the clone page are not copied: deferred
+        fields are copied by the database, excluded ones keep their default value.
+        Returns the new objects.
+        '''
+        opts = self.model._meta
+        omitted = set(self.get_clone_omitted_fields())
+        fields = [f for f in opts.concrete_fields if not f.primary_key and f.name not in omitted]
+        values = dict((f.attname, getattr(original_obj, f.attname)) for f in fields)
+        unique_values = self.get_unique_clone_values(
+            model_to_dict(original_obj, fields=[f.name for f in fields]), len(variations))
+        unique_fields = [f for f in opts.concrete_fields if f.unique and not f.primary_key]
+        taken = dict((f.attname, set()) for f in unique_fields)
+
+        new_objects = []
+        deferred = {}
+        for n, (overrides, unique) in enumerate(zip(variations, unique_values)):
+            new_object = self.model(**values)
+            for name, value in dict(unique, **overrides).items():
+                try:
+                    field = opts.get_field(name)
+                except FieldDoesNotExist:
+                    raise ValidationError(_('Row {row}: unknown field "{name}".').format(
+                        row=n + 1, name=name))
+                if field.primary_key or field.many_to_many or not field.concrete:
+                    raise ValidationError(_('Row {row}: field "{name}" can not be set.').format(
+                        row=n + 1, name=name))
+                try:
+                    if field.is_relation:
+                        value = field.target_field.to_python(value)
+                    else:
+                        value = field.to_python(value)
+                except ValidationError as e:
+                    raise ValidationError(_('Row {row}, field "{name}": {error}').format(
+                        row=n + 1, name=name, error=u' '.join(e.messages)))
+                setattr(new_object, field.attname, value)
+
+            not_set = [name for name in omitted if name not in overrides]
+            try:
+                new_object.full_clean(exclude=not_set)
+            except ValidationError as e:
+                raise ValidationError(row_errors(n + 1, e))
+            for field in unique_fields:
+                value = getattr(new_object, field.attname)
+                if value in taken[field.attname]:
+                    raise ValidationError(
+                        _('Row {row}, field "{name}": {error}').format(
+                            row=n + 1, name=field.name,
+                            error=_('This value is already used by another row.')))
+                if value is not None:
+                    taken[field.attname].add(value)
+
+            copied = tuple(name for name in self.clone_defer_fields if name not in overrides)
+            deferred.setdefault(copied, []).append(new_object)
+            new_objects.append(new_object)
+
+        inlines = list(self.get_cloned_formsets_with_inlines(request))
+        models = [self.model] + [FormSet.model for FormSet, inline, prefix in inlines]
+        using = router.db_for_write(self.model)
+        with self.buffer_clone_signals(models) as signals, transaction.atomic(using=using):
+            features = connections[using].features
+            can_return_pks = getattr(features, 'can_return_rows_from_bulk_insert',
+                                     getattr(features, 'can_return_ids_from_bulk_insert', False))
+            if can_return_pks and not opts.parents:
+                self.model._default_manager.bulk_create(new_objects)
+                if signals is not None:
+                    signals.add(self.model, [new_object.pk for new_object in new_objects])
+            else:
+                for new_object in new_objects:
+                    new_object.save(force_insert=True)
+            for names, objects in deferred.items():
+                self.copy_fields_from(original_obj, objects, names)
+
+            for FormSet, inline, prefix in inlines:
+                if self.is_virtual_inline(FormSet, prefix):
+                    self.record_virtual_inline(original_obj, new_objects, FormSet)
+                    continue
+                queryset = self.get_cloned_inline_queryset(
+                    request, inline, FormSet, prefix, original_obj)
+                pks = copy_rows(queryset, inline_parent_fields(FormSet)[-1], new_objects,
+                                self.clone_chunk_size, with_pks=signals is not None)
+                add_created(signals, FormSet.model, pks)
+
+            for field in opts.many_to_many:
+                through = _remote_field(field).through
+                source = field.m2m_field_name()
+                queryset = through._default_manager.filter(**{source: original_obj})
+                pks = copy_rows(queryset, source, new_objects, self.clone_chunk_size,
+                                with_pks=signals is not None)
+                add_created(signals, through, pks)
+
+            self.record_lineage(original_obj, new_objects)
+            for new_object in new_objects:
+                self.log_clone(request, new_object)
+
+        return new_objects
+
+    def clone_estimate_view(self, request, object_id):
+        '''
+        Returns the cost estimate of cloning an object, and the strategy it gets, as JSON
+        '''
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+
+        original_obj = self.get_clone_object(request, unquote(object_id))
+
+        if original_obj is None:
+            raise self.clone_object_not_found(object_id)
+
+        estimate = self.estimate_clone_cost(request, original_obj)
+        estimate['strategy'] = self.get_clone_strategy(estimate)
+        return JsonResponse(estimate)
+
+    def estimate_clone_cost(self, request, original_obj):
+        """Returns what cloning ``original_obj`` copies, counted with aggregate queries.
+
+        The estimate is a dictionary with the number of rows of each inline, by prefix,
+        in ``inlines``, the number of links of each many-to-many field in ``m2m``, the
+        number of files referenced by the object and its inlines in ``files``, and
+        their size in ``file_bytes``, or ``None`` if some file field has no size field
+        in ``clone_file_size_fields``. ``rows`` adds up the rows a clone inserts:
+        the object, the inline rows that aren't virtual and the many-to-many links.
+        """
+        opts = self.model._meta
+        size_fields = self.clone_file_size_fields
+        using = self.get_clone_read_database(request)
+        estimate = {'rows': 1, 'inlines': {}, 'm2m': {}, 'files': 0, 'file_bytes': 0}
+
+        def add(rows, files, file_bytes):
+            estimate['files'] += files
+            if file_bytes is None or estimate['file_bytes'] is None:
+                estimate['file_bytes'] = None
+            else:
+                estimate['file_bytes'] += file_bytes
+
+        if any(isinstance(field, FileField) for field in opts.concrete_fields):
+            queryset = self.model._default_manager.filter(pk=original_obj.pk)
+            if using:
+                queryset = queryset.using(using)
+            add(*count_rows_and_files(queryset, size_fields))
+
+        for FormSet, inline, prefix in self.get_cloned_formsets_with_inlines(request):
+            queryset = self.get_cloned_inline_queryset(
+                request, inline, FormSet, prefix, original_obj)
+            rows, files, file_bytes = count_rows_and_files(queryset, size_fields)
+            estimate['inlines'][prefix] = rows
+            if not self.is_virtual_inline(FormSet, prefix):
+                estimate['rows'] += rows
+            add(rows, files, file_bytes)
+
+        for field in opts.many_to_many:
+            through = _remote_field(field).through
+            queryset = through._default_manager.filter(**{field.m2m_field_name(): original_obj})
+            if using:
+                queryset = queryset.using(using)
+            links = queryset.count()
+            estimate['m2m'][field.name] = links
+            estimate['rows'] += links
+
+        return estimate
+
+    def get_clone_strategy(self, estimate):
+        """Returns how to clone an object, given its ``estimate_clone_cost()``.
+
+        ``'form'`` renders every inline row on the clone page, ``'bulk'`` leaves the
+        inlines out of the page and copies them on save, like ``clone_streamed_inlines``,
+        and ``'deferred'`` does the same but saves with ``save_deferred_clone()``.
+        """
+        rows = estimate['rows']
+        if self.clone_deferred_threshold is not None and rows > self.clone_deferred_threshold:
+            return CLONE_DEFERRED
+        if self.clone_bulk_threshold is not None and rows > self.clone_bulk_threshold:
+            return CLONE_BULK
+        return CLONE_FORM
+
+    def get_clone_page_strategy(self, request, original_obj, estimate=None):
+        '''
+        Returns the strategy of the clone page of ``original_obj``, from its
+        ``estimate_clone_cost()`` if given
+
+        A submitted page is saved the way it was rendered: from its inline forms if
+        it showed them, in bulk otherwise, deferred if it has grown too big since.
+        '''
+        if self.clone_bulk_threshold is None and self.clone_deferred_threshold is None:
+            return CLONE_FORM
+        if estimate is None:
+            estimate = self.estimate_clone_cost(request, original_obj)
+        strategy = self.get_clone_strategy(estimate)
+        if request.method == 'POST':
+            posted = request.POST.get('_clone_strategy')
+            if posted in (CLONE_FORM, CLONE_BULK) and strategy != CLONE_DEFERRED:
+                return posted
+            if posted in (CLONE_BULK, CLONE_DEFERRED):
+                return CLONE_DEFERRED
+            # rendered with the inlines, they must be saved from the form
+            return CLONE_FORM
+        return strategy
+
+    def is_streamed_inline(self, prefix, strategy=CLONE_FORM):
+        '''
+        Returns whether the inline is left out of the clone page and copied on save
+        '''
+        return (strategy != CLONE_FORM or prefix in self.clone_streamed_inlines or
+                prefix in self.clone_virtual_inlines)
+
+    def clone_object_not_found(self, object_id):
+        return Http404(_('{name} object with primary key {key} does not exist.'.format(
+            name=force_text(self.model._meta.verbose_name),
+            key=repr(escape(object_id))
+        )))
+
+    def record_lineage(self, original_obj, new_objects):
+        if self.clone_record_lineage:
+            from .models import CloneLineage
+            CloneLineage.objects.record(original_obj, new_objects)
+
+    def log_clone(self, request, new_object):
+        try:
+            self.log_addition(request, new_object)
+        except TypeError:
+            # In Django 1.9 we need one more param
+            self.log_addition(request, new_object, "Cloned object")
+
+    def formfield_for_clone_dbfield(self, db_field, request, **kwargs):
+        '''
+        ``formfield_for_dbfield()`` for the clone page when ``clone_lightweight_relations``
+        is set
+        '''
+        formfield = self.formfield_for_dbfield(db_field, request, **kwargs)
+        if formfield is None or not hasattr(formfield, 'queryset'):
+            return formfield
+        if db_field.name in self.raw_id_fields:
+            return formfield
+        if db_field.name in getattr(self, 'get_autocomplete_fields', lambda request: ())(request):
+            return formfield
+
+        widget = self.get_clone_relation_widget(request, db_field)
+        widget.choices = formfield.choices
+        if isinstance(formfield.widget, RelatedFieldWidgetWrapper):
+            formfield.widget.widget = widget
+        else:
+            formfield.widget = widget
+        return formfield
+
+    def get_clone_relation_widget(self, request, db_field):
+        '''
+        Returns a widget for ``db_field`` that only loads the related objects selected
+        '''
+        remote_field = _remote_field(db_field)
+        using = self.get_clone_read_database(request)
+        related_admin = self.admin_site._registry.get(remote_field.model)
+        if AutocompleteSelect is not None and related_admin and related_admin.search_fields:
+            # since django 3.2 autocomplete widgets take the field itself
+            rel = db_field if VERSION[:2] >= (3, 2) else remote_field
+            if db_field.many_to_many:
+                return AutocompleteSelectMultiple(rel, self.admin_site, using=using)
+            return AutocompleteSelect(rel, self.admin_site, using=using)
+        if db_field.many_to_many:
+            return ManyToManyRawIdWidget(remote_field, self.admin_site, using=using)
+        return ForeignKeyRawIdWidget(remote_field, self.admin_site, using=using)
+
+    def get_clone_omitted_fields(self):
+        '''
+        Returns the names of the fields not loaded or displayed on the clone page
+        '''
+        return list(self.clone_defer_fields) + list(self.clone_exclude_fields)
+
+    def get_clone_object(self, request, object_id):
+        """Returns the object to clone, or ``None`` if there is none.
+
+        This is ``get_object()``, unless fields are omitted on the clone page or read
+        from ``clone_read_database``: the object is then looked up by primary key in
+        ``get_clone_queryset()``. An admin overriding ``get_object()`` with some
+        other lookup and using these options should override this method as well.
+        """
+        using = self.get_clone_read_database(request)
+        if not using and not self.get_clone_omitted_fields():
+            return self.get_object(request, object_id)
+
+        queryset = self.get_clone_queryset(request)
+        model = queryset.model
+        try:
+            object_id = model._meta.pk.to_python(object_id)
+            return queryset.get(pk=object_id)
+        except (model.DoesNotExist, ValidationError, ValueError):
+            return None
+
+    def get_clone_queryset(self, request):
+        '''
+        Returns ``get_queryset()`` read from ``clone_read_database``, without the
+        fields omitted on the clone page
+        '''
+        queryset = self.get_queryset(request)
+        using = self.get_clone_read_database(request)
+        if using:
+            queryset = queryset.using(using)
+        omitted = self.get_clone_omitted_fields()
+        if omitted:
+            queryset = queryset.defer(*omitted)
+        return queryset
+
+    def get_clone_fieldsets(self, request):
+        '''
+        Returns ``get_fieldsets()`` without the fields omitted on the clone page
+        '''
+        omitted = set(self.get_clone_omitted_fields())
+        if not omitted:
+            return list(self.get_fieldsets(request))
+
+        fieldsets = []
+        for name, options in self.get_fieldsets(request):
+            fields = []
+            for field in options.get('fields', ()):
+                if isinstance(field, (list, tuple)):
+                    field = tuple(f for f in field if f not in omitted)
+                    if field:
+                        fields.append(field)
+                elif field not in omitted:
+                    fields.append(field)
+            options = dict(options, fields=fields)
+            fieldsets.append((name, options))
+        return fieldsets
+
+    def get_clone_unique_fields(self):
+        '''
+        Returns the unique text fields that ``get_unique_clone_values()`` takes care of
+        '''
+        if not self.clone_deduplicate_unique_fields:
+            return []
+        omitted = self.get_clone_omitted_fields()
+        # not subclasses like EmailField or URLField, a suffix would make them invalid
+        return [field for field in self.model._meta.fields
+                if field.unique and not field.primary_key
+                and type(field) in (CharField, SlugField) and field.name not in omitted]
+
+    def get_unique_clone_values(self, fields, count=1, using=None):
+        '''
+        Returns ``count`` dictionaries with new values for the unique fields in ``fields``
+
+        A value "title" or "title (2)" becomes "title (2)", "title (3)" and so on,
+        skipping values already taken. Slugs become "title-2", "title-3". Values that
+        would be longer than the field lose the end of "title". The values taken are
+        fetched with one query per field, no matter how many copies are asked for,
+        from database ``using``.
+        '''
+        copies = [{} for i in range(count)]
+        manager = self.model._default_manager.db_manager(using)
+        for field in self.get_clone_unique_fields():
+            value = fields.get(field.name)
+            if not value:
+                continue
+
+            if isinstance(field, SlugField):
+                # can't tell a suffix from a slug ending in a number
+                template, base = u'{0}-{1}', value
+            else:
+                template, base = u'{0} ({1})', re.sub(r' \(\d+\)$', '', value)
+            max_length = field.max_length
+
+            def make_value(n):
+                value = template.format(base, n)
+                excess = len(value) - max_length if max_length else 0
+                if excess <= 0:
+                    return value
+                if excess >= len(base):
+                    # no room for the suffix
+                    return None
+                return template.format(base[:-excess], n)
+
+            shortest = base
+            if max_length:
+                # the base of values with suffixes up to " (99999)" may be cut
+                shortest = base[:max(1, max_length - len(template.format('', 99999)))]
+            if shortest != base:
+                lookup = Q(**{field.name + '__startswith': shortest})
+            else:
+                prefix = template.format(base, '')[:len(base) + 2]
+                lookup = Q(**{field.name: base}) | Q(**{field.name + '__startswith': prefix})
+            taken = set(manager.filter(lookup).values_list(field.name, flat=True))
+
+            n = 2
+            for copy in copies:
+                while make_value(n) in taken:
+                    n += 1
+                value = make_value(n)
+                if value is None:
+                    break
+                copy[field.name] = value
+                n += 1
+        return copies
+
+    def copy_deferred_fields(self, original_obj, new_object):
+        '''
+        Copies ``clone_defer_fields`` from ``original_obj`` to the saved ``new_object``
+
+        The values are copied by the database in a single UPDATE and are never
+        loaded in python.
+        '''
+        self.copy_fields_from(original_obj, [new_object], self.clone_defer_fields)
+
+    def copy_fields_from(self, original_obj, new_objects, names):
+        '''
+        Copies the fields ``names`` of ``original_obj`` to the saved ``new_objects``,
+        in a single UPDATE
+        '''
+        if not names or not new_objects:
+            return
+
+        manager = self.model._default_manager
+        source = manager.filter(pk=original_obj.pk)
+        if Subquery is not None:
+            values = dict((name, Subquery(source.values(name)[:1])) for name in names)
+        else:
+            values = source.values(*names)[0]
+        manager.filter(pk__in=[new_object.pk for new_object in new_objects]).update(**values)
+
+        # the values in memory are stale, make them load from the database
+        # if anyone needs them
+        for name in names:
+            attname = self.model._meta.get_field(name).attname
+            for new_object in new_objects:
+                new_object.__dict__.pop(attname, None)
+
+    def get_clone_read_database(self, request):
+        '''
+        Returns the database alias the clone reads from, ``None`` for the default routing
+        '''
+        if request.method == 'POST' and self.clone_read_source_from_primary:
+            return None
+        return self.clone_read_database
+
+    def get_clone_link_query(self):
+        if self.clone_link_inlines is None:
+            return ''
+        return '?' + urlencode({'inlines': ','.join(self.clone_link_inlines)})
+
+    def get_cloned_inlines(self, request):
+        '''
+        Returns the prefixes of the inlines asked for with ``?inlines=comment_set,...``,
+        or ``None`` if the request doesn't choose
+        '''
+        if 'inlines' not in request.GET:
+            return None
+        return set(prefix.strip() for value in request.GET.getlist('inlines')
+                   for prefix in value.split(',') if prefix.strip())
+
+    def get_cloned_formsets_with_inlines(self, request):
+        '''
+        Yields ``(FormSet, inline, prefix)`` for each inline of the clone page
+        '''
+        cloned_inlines = self.get_cloned_inlines(request)
+        prefixes = {}
+        for FormSet, inline in self.get_formsets_with_inlines(request):
+            prefix = FormSet.get_default_prefix()
+            prefixes[prefix] = prefixes.get(prefix, 0) + 1
+            if prefixes[prefix] != 1 or not prefix:
+                prefix = "%s-%s" % (prefix, prefixes[prefix])
+            if cloned_inlines is not None and prefix not in cloned_inlines:
+                continue
+            yield FormSet, inline, prefix
+
+    def get_cloned_inline_queryset(self, request, inline, FormSet, prefix, original_obj):
+        '''
+        Returns the rows of ``inline`` that belong to ``original_obj``, filtered by
+        ``filter_cloned_inline_queryset()``
+        '''
+        queryset = inline.get_queryset(request)
+        if hasattr(FormSet, 'ct_fk_field'):
+            # generic inline, django.contrib.contenttypes.admin.GenericInlineModelAdmin
+            from django.contrib.contenttypes.models import ContentType
+            content_type = ContentType.objects.db_manager(queryset.db).get_for_model(
+                original_obj, for_concrete_model=FormSet.for_concrete_model)
+            queryset = queryset.filter(**{
+                FormSet.ct_field.name: content_type,
+                FormSet.ct_fk_field.name: original_obj.pk,
+            })
+        else:
+            queryset = queryset.filter(**{FormSet.fk.name: original_obj})
+        using = self.get_clone_read_database(request)
+        if using:
+            queryset = queryset.using(using)
+        return self.filter_cloned_inline_queryset(request, prefix, queryset)
+
+    def is_virtual_inline(self, FormSet, prefix):
+        # generic inlines are always copied
+        return prefix in self.clone_virtual_inlines and not hasattr(FormSet, 'ct_fk_field')
+
+    def record_virtual_inline(self, original_obj, new_objects, FormSet):
+        from .models import VirtualRelation
+        self.watch_virtual_deletes()
+        VirtualRelation.objects.record(original_obj, new_objects, FormSet.model,
+                                       FormSet.fk.name)
+
+    def watch_virtual_deletes(self):
+        '''
+        Makes sure deleting an object of the model, however it's done, first gives
+        its virtual clones their own rows
+        '''
+        from .models import forget_virtual_relations
+        pre_delete.connect(forget_virtual_relations, sender=self.model, weak=False,
+                           dispatch_uid='modelclone.virtual.{0}.{1}'.format(
+                               self.model._meta.app_label, self.model.__name__))
+
+    def materialize_virtual_inlines(self, obj, formsets=()):
+        '''
+        Copies the rows ``obj`` still shares with the object it was cloned from
+
+        The relations shown in ``formsets`` were saved from them as new rows already,
+        and are only forgotten.
+        '''
+        from django.contrib.contenttypes.models import ContentType
+        from .models import VirtualRelation
+        for formset in formsets:
+            if getattr(formset, 'virtual', False):
+                VirtualRelation.objects.of(obj).filter(
+                    related_content_type=ContentType.objects.get_for_model(formset.model),
+                    fk_name=formset.fk.name,
+                ).delete()
+        VirtualRelation.objects.materialize(obj, self.clone_chunk_size)
+
+    def materialize_virtual_clones(self, obj):
+        '''
+        Copies the rows of ``obj`` to the clones sharing them, before ``obj`` changes
+        '''
+        from .models import VirtualRelation
+        VirtualRelation.objects.materialize_clones_of(obj, self.clone_chunk_size)
+
+    def clone_streamed_inline(self, request, queryset, fk_name, new_object):
+        '''
+        Copies the rows in ``queryset`` to ``new_object``
+
+        Rows are read with a server-side cursor and inserted with ``bulk_create``,
+        ``clone_chunk_size`` at a time, so memory doesn't grow with the number of
+        rows. Model ``save()`` and signals are not called for the copies. Returns
+        their primary keys if ``clone_buffer_signals`` is set, to be sent with
+        ``objects_cloned``.
+        '''
+        return copy_rows(queryset, fk_name, [new_object], self.clone_chunk_size,
+                         with_pks=self.clone_buffer_signals)
+
     def tweak_cloned_fields(self, fields):
         """Override this method to tweak a cloned object before displaying its form.
 
@@ -227,6 +1322,18 @@ class ClonableModelAdmin(ModelAdmin):
         """
         return fields
 
+    def filter_cloned_inline_queryset(self, request, related_name, queryset):
+        """Override this method to choose which inline rows are cloned, in SQL.
+
+        ``related_name`` is the prefix of the inline, like in ``tweak_cloned_inline_fields()``.
+
+        ``queryset`` holds the inline rows of the original object. Unlike
+        ``tweak_cloned_inline_fields()`` the rows left out are never fetched.
+
+        This method returns the filtered ``queryset``.
+        """
+        return queryset
+
     def tweak_cloned_inline_fields(self, related_name, fields_list):
         """Override this method to tweak a cloned inline before displaying its form.
 
@@ -241,6 +1348,241 @@ class ClonableModelAdmin(ModelAdmin):
         """
         return fields_list
 
+@contextmanager
+def _no_buffer():
+    yield None
+
+def virtual_formset(FormSet, rows):
+    '''
+    Returns a ``FormSet`` for an object sharing ``rows`` with the object it was cloned
+    from: they are shown as new rows, only created when the form is saved
+    '''
+    class VirtualFormSet(FormSet):
+        virtual = True
+
+        def __init__(self, *args, **kwargs):
+            kwargs['queryset'] = FormSet.model._default_manager.none()
+            if not args and kwargs.get('data') is None:
+                exclude = [FormSet.model._meta.pk.name] + inline_parent_fields(FormSet)
+                kwargs['initial'] = [model_to_dict(row, exclude=exclude) for row in rows]
+                self.extra = len(kwargs['initial']) + self.extra
+            super(VirtualFormSet, self).__init__(*args, **kwargs)
+
+    VirtualFormSet.__name__ = FormSet.__name__
+    return VirtualFormSet
+
+def inline_parent_fields(FormSet):
+    '''
+    Returns the names of the fields of an inline model that point to the parent
+    object, the field holding the parent's primary key last
+    '''
+    if hasattr(FormSet, 'ct_fk_field'):
+        return [FormSet.ct_field.name, FormSet.ct_fk_field.name]
+    return [FormSet.fk.name]
+
+def copy_rows(queryset, fk_name, parents, chunk_size=500, with_pks=False):
+    '''
+    Inserts a copy of each row in ``queryset`` for each object in ``parents``, with
+    the foreign key ``fk_name`` pointing to that parent
+
+    ``fk_name`` can also be the object id field of a generic relation, in which case
+    it's set to the parent's primary key.
+
+    Rows are read with a server-side cursor and inserted with ``bulk_create``, about
+    ``chunk_size`` at a time. With ``with_pks``, returns the primary keys of the
+    copies. Databases that don't return them from bulk inserts take one more query
+    per ``chunk_size`` parents, for the rows pointing to the parents: being new,
+    all of them are copies.
+    '''
+    model = queryset.model
+    manager = model._default_manager
+    fields = [f for f in model._meta.concrete_fields
+              if not f.primary_key and f.name != fk_name]
+    generic = not model._meta.get_field(fk_name).is_relation
+    ct_attname = generic and _generic_ct_attname(model, fk_name)
+    content_types = set()
+    pks = []
+    returned = True
+    batch = []
+    for obj in _iterator(queryset, chunk_size):
+        values = dict((f.attname, getattr(obj, f.attname)) for f in fields)
+        if ct_attname:
+            content_types.add(values[ct_attname])
+        for parent in parents:
+            values[fk_name] = parent.pk if generic else parent
+            batch.append(model(**values))
+        if len(batch) >= chunk_size:
+            manager.bulk_create(batch)
+            returned = returned and batch[0].pk is not None
+            if with_pks and returned:
+                pks.extend(obj.pk for obj in batch)
+            batch = []
+    if batch:
+        manager.bulk_create(batch)
+        returned = returned and batch[0].pk is not None
+        if with_pks and returned:
+            pks.extend(obj.pk for obj in batch)
+
+    if not with_pks:
+        return None
+    if returned:
+        return pks
+
+    pks = []
+    copies = manager.all()
+    if ct_attname:
+        copies = copies.filter(**{ct_attname + '__in': content_types})
+    for start in range(0, len(parents), chunk_size):
+        chunk = [parent.pk for parent in parents[start:start + chunk_size]]
+        lookup = fk_name + '__in' if generic else model._meta.get_field(fk_name).attname + '__in'
+        pks.extend(copies.filter(**{lookup: chunk}).values_list('pk', flat=True))
+    return pks
+
+def _generic_ct_attname(model, fk_field):
+    '''
+    Returns the attname of the content type field of the generic foreign key using
+    the object id field ``fk_field`` of ``model``, if any
+    '''
+    from django.contrib.contenttypes.fields import GenericForeignKey
+    opts = model._meta
+    # private_fields were virtual_fields before django 1.10
+    private_fields = opts.private_fields if hasattr(opts, 'private_fields') else opts.virtual_fields
+    for field in private_fields:
+        if isinstance(field, GenericForeignKey) and field.fk_field == fk_field:
+            return opts.get_field(field.ct_field).attname
+    return None
+
+def add_created(signals, model, pks):
+    '''
+    Records rows inserted in bulk with ``buffered_signals`` ``signals``, if any
+    '''
+    if signals is not None and pks:
+        signals.add(model, pks)
+
+def count_rows_and_files(queryset, size_fields):
+    '''
+    Returns ``(rows, files, file_bytes)`` of ``queryset``, with a single aggregate query
+
+    ``files`` counts the file fields that are set, ``file_bytes`` adds up their size
+    fields from ``size_fields``, and is ``None`` when a file field has none.
+    '''
+    aggregates = {'rows': Count('pk')}
+    sized = True
+    for field in queryset.model._meta.concrete_fields:
+        if not isinstance(field, FileField):
+            continue
+        is_set = Q(**{field.name + '__gt': ''})
+        aggregates['files_' + field.name] = Sum(Case(
+            When(is_set, then=Value(1)), default=Value(0), output_field=IntegerField()))
+        size_field = size_fields.get(field.name)
+        if size_field is None:
+            sized = False
+        else:
+            aggregates['bytes_' + field.name] = Sum(Case(
+                When(is_set, then=F(size_field)), default=Value(0),
+                output_field=IntegerField()))
+
+    result = queryset.aggregate(**aggregates)
+    files = sum(value or 0 for key, value in result.items() if key.startswith('files_'))
+    file_bytes = None
+    if sized:
+        file_bytes = sum(value or 0 for key, value in result.items() if key.startswith('bytes_'))
+    return result['rows'], files, file_bytes
+
+def row_errors(row, error):
+    '''
+    Returns the messages of the ``ValidationError`` of a ``clone_many()`` row
+    '''
+    if not hasattr(error, 'error_dict'):
+        return [_('Row {row}: {error}').format(row=row, error=message)
+                for message in error.messages]
+    messages = []
+    for name, field_messages in sorted(error.message_dict.items()):
+        for message in field_messages:
+            if name == NON_FIELD_ERRORS:
+                messages.append(_('Row {row}: {error}').format(row=row, error=message))
+            else:
+                messages.append(_('Row {row}, field "{name}": {error}').format(
+                    row=row, name=name, error=message))
+    return messages
+
+def touch(cache, key, timeout):
+    '''
+    Restarts the expiry of ``key``, on caches that can (django 2.1+)
+    '''
+    if hasattr(cache, 'touch'):
+        cache.touch(key, timeout)
+
+def read_choices_from(form_class, using):
+    '''
+    Makes the choice fields of ``form_class`` load their choices from database ``using``
+    '''
+    if not using:
+        return
+    for field in form_class.base_fields.values():
+        queryset = getattr(field, 'queryset', None)
+        if queryset is not None:
+            field.queryset = queryset.using(using)
+
+def parse_variations(data):
+    '''
+    Parses a table of field overrides, in CSV or JSON, into a list of dictionaries
+
+    ``data`` is a string or an uploaded file. Empty CSV cells are left out.
+    '''
+    if hasattr(data, 'read'):
+        data = data.read()
+    if isinstance(data, bytes):
+        data = data.decode('utf-8-sig')
+
+    if data.lstrip().startswith('['):
+        variations = json.loads(data)
+        if not all(isinstance(row, dict) for row in variations):
+            raise ValueError(_('Expected a JSON list of objects.'))
+        return variations
+
+    return [dict((name, value) for name, value in row.items() if value not in ('', None))
+            # a file object, so that quoted cells can span lines
+            for row in csv.DictReader(io.StringIO(data))]
+
+def _remote_field(field):
+    # ``rel`` was renamed to ``remote_field`` on django 1.9
+    return getattr(field, 'remote_field', None) or field.rel
+
+def _iterator(queryset, chunk_size):
+    if VERSION[0] < 2:
+        # ``chunk_size`` was added on django 2.0
+        return queryset.iterator()
+    return queryset.iterator(chunk_size=chunk_size)
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+class QueryCounter(object):
+    '''
+    Context manager counting the queries run on all databases in the current thread
+    '''
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        for alias in connections:
+            connections[alias].execute_wrappers.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for alias in connections:
+            connections[alias].execute_wrappers.remove(self)
+
+if VERSION[0] < 2:
+    # execute_wrappers were added on django 2.0
+    QueryCounter = None
+
 class InlineAdminFormSetFakeOriginal(helpers.InlineAdminFormSet):
 
     def __iter__(self):
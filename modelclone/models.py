@@ -0,0 +1,251 @@
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.models import ContentType
+from django.db import models, router, transaction
+from django.utils.encoding import force_text
+
+
+class CloneLineageQuerySet(models.QuerySet):
+
+    def clones_of(self, obj):
+        '''
+        Records of the objects cloned directly from ``obj``
+        '''
+        return self.filter(
+            source_content_type=ContentType.objects.get_for_model(obj),
+            source_object_id=force_text(obj.pk),
+        )
+
+    def source_of(self, obj):
+        '''
+        Records of the object ``obj`` was cloned from, empty if it's not a clone
+        '''
+        return self.filter(
+            target_content_type=ContentType.objects.get_for_model(obj),
+            target_object_id=force_text(obj.pk),
+        )
+
+    def ancestors(self, obj, max_depth=None):
+        '''
+        Records from the object ``obj`` was cloned from up to the first original,
+        closest first
+
+        Runs one indexed query per generation.
+        '''
+        content_type = ContentType.objects.get_for_model(obj)
+        object_id = force_text(obj.pk)
+        ancestors = []
+        seen = set([object_id])
+        while max_depth is None or len(ancestors) < max_depth:
+            record = self.filter(target_content_type=content_type,
+                                 target_object_id=object_id).first()
+            if record is None or record.source_object_id in seen:
+                break
+            ancestors.append(record)
+            content_type = record.source_content_type_id
+            object_id = record.source_object_id
+            seen.add(object_id)
+        return ancestors
+
+    def descendants(self, obj, max_depth=None):
+        '''
+        Records of the clones of ``obj``, the clones of these clones and so on,
+        generation by generation
+
+        Runs one indexed query per generation, which selects its sources from the
+        previous generation in a subquery.
+        '''
+        content_type = ContentType.objects.get_for_model(obj)
+        generation = self.filter(source_content_type=content_type,
+                                 source_object_id=force_text(obj.pk))
+        seen = set([force_text(obj.pk)])
+        descendants = []
+        depth = 0
+        while max_depth is None or depth < max_depth:
+            records = [record for record in generation if record.target_object_id not in seen]
+            if not records:
+                break
+            descendants.extend(records)
+            seen.update(record.target_object_id for record in records)
+            generation = self.filter(
+                source_content_type=content_type,
+                source_object_id__in=generation.values('target_object_id'))
+            depth += 1
+        return descendants
+
+    def record(self, source, targets):
+        '''
+        Records that each object in ``targets`` was cloned from ``source``, in
+        a single insert
+        '''
+        source_content_type = ContentType.objects.get_for_model(source)
+        return self.bulk_create([
+            self.model(
+                source_content_type=source_content_type,
+                source_object_id=force_text(source.pk),
+                target_content_type=ContentType.objects.get_for_model(target),
+                target_object_id=force_text(target.pk),
+            )
+            for target in targets
+        ])
+
+
+class CloneLineage(models.Model):
+    '''
+    Records where a cloned object came from
+    '''
+    source_content_type = models.ForeignKey(ContentType, related_name='+',
+                                            on_delete=models.CASCADE)
+    source_object_id = models.CharField(max_length=255)
+    source = GenericForeignKey('source_content_type', 'source_object_id')
+
+    target_content_type = models.ForeignKey(ContentType, related_name='+',
+                                            on_delete=models.CASCADE)
+    target_object_id = models.CharField(max_length=255)
+    target = GenericForeignKey('target_content_type', 'target_object_id')
+
+    created = models.DateTimeField(auto_now_add=True)
+
+    objects = CloneLineageQuerySet.as_manager()
+
+    class Meta:
+        index_together = [
+            ('source_content_type', 'source_object_id'),
+            ('target_content_type', 'target_object_id'),
+        ]
+
+    def __unicode__(self):
+        return u'{0}.{1} cloned from {2}.{3}'.format(
+            self.target_content_type_id, self.target_object_id,
+            self.source_content_type_id, self.source_object_id)
+
+    __str__ = __unicode__
+
+
+class VirtualRelationQuerySet(models.QuerySet):
+
+    def of(self, obj):
+        '''
+        Virtual relations of the clone ``obj``
+        '''
+        return self.filter(
+            content_type=ContentType.objects.get_for_model(obj),
+            object_id=force_text(obj.pk),
+        )
+
+    def record(self, source, targets, related_model, fk_name):
+        '''
+        Records that the ``related_model`` rows of each object in ``targets``, through
+        the foreign key ``fk_name``, are the rows of ``source``, in a single insert
+
+        If ``source`` is itself a virtual clone for these rows, the clones point to
+        the object the rows really belong to.
+        '''
+        related_content_type = ContentType.objects.get_for_model(related_model)
+        source_id = force_text(source.pk)
+        relation = self.of(source).filter(related_content_type=related_content_type,
+                                          fk_name=fk_name).first()
+        if relation is not None:
+            source_id = relation.source_object_id
+        return self.bulk_create([
+            self.model(
+                content_type=ContentType.objects.get_for_model(target),
+                object_id=force_text(target.pk),
+                source_object_id=source_id,
+                related_content_type=related_content_type,
+                fk_name=fk_name,
+            )
+            for target in targets
+        ])
+
+    def materialize(self, obj, chunk_size=500):
+        '''
+        Copies the rows the clone ``obj`` shares with its source, making it a
+        regular object
+        '''
+        from .admin import copy_rows
+        with transaction.atomic(using=router.db_for_write(obj.__class__)):
+            for relation in self.of(obj).select_for_update():
+                copy_rows(relation.source_rows(), relation.fk_name, [obj], chunk_size)
+                relation.delete()
+
+    def materialize_clones_of(self, obj, chunk_size=500):
+        '''
+        Materializes the clones sharing rows of ``obj``, to be called before the rows
+        of ``obj`` are changed or deleted
+        '''
+        content_type = ContentType.objects.get_for_model(obj)
+        object_ids = self.filter(
+            content_type=content_type,
+            source_object_id=force_text(obj.pk),
+        ).values_list('object_id', flat=True)
+        for clone in obj.__class__._default_manager.filter(pk__in=list(object_ids)):
+            self.materialize(clone, chunk_size)
+
+
+class VirtualRelation(models.Model):
+    '''
+    Records that the rows of a relation of a clone are still those of its source
+
+    The rows are copied when the clone is edited in the admin, or with
+    ``VirtualRelation.objects.materialize()``.
+    '''
+    content_type = models.ForeignKey(ContentType, related_name='+',
+                                     on_delete=models.CASCADE)
+    object_id = models.CharField(max_length=255)
+    clone = GenericForeignKey('content_type', 'object_id')
+    source_object_id = models.CharField(max_length=255)
+
+    related_content_type = models.ForeignKey(ContentType, related_name='+',
+                                             on_delete=models.CASCADE)
+    fk_name = models.CharField(max_length=255)
+
+    objects = VirtualRelationQuerySet.as_manager()
+
+    class Meta:
+        index_together = [
+            ('content_type', 'object_id'),
+            ('content_type', 'source_object_id'),
+        ]
+
+    def source_rows(self):
+        '''
+        The rows the clone shares with its source
+        '''
+        related_model = self.related_content_type.model_class()
+        return related_model._default_manager.filter(
+            **{self.fk_name: self.source_object_id}).order_by('pk')
+
+    def __unicode__(self):
+        return u'{0}.{1} shares {2} rows of {3}'.format(
+            self.content_type_id, self.object_id,
+            self.related_content_type_id, self.source_object_id)
+
+    __str__ = __unicode__
+
+
+def forget_virtual_relations(sender, instance, **kwargs):
+    '''
+    ``pre_delete`` receiver giving the clones of ``instance`` their own copy of the
+    rows they share with it, and forgetting the rows ``instance`` shares with its source
+    '''
+    VirtualRelation.objects.materialize_clones_of(instance)
+    VirtualRelation.objects.of(instance).delete()
+
+
+class CopyOnWriteQuerySet(models.QuerySet):
+
+    def of(self, parent, fk_name):
+        '''
+        Rows pointing to ``parent`` through the foreign key ``fk_name``, or the rows of
+        its source if ``parent`` is a virtual clone that didn't copy them yet
+        '''
+        relation = VirtualRelation.objects.of(parent).filter(
+            related_content_type=ContentType.objects.get_for_model(self.model),
+            fk_name=fk_name,
+        ).first()
+        if relation is not None:
+            return self.filter(**{fk_name: relation.source_object_id})
+        return self.filter(**{fk_name: parent})
+
+
+CopyOnWriteManager = models.Manager.from_queryset(CopyOnWriteQuerySet)
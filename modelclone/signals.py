@@ -0,0 +1,100 @@
+import threading
+
+from django.db.models.signals import m2m_changed, post_save, pre_save
+from django.dispatch import Signal
+
+
+# Sent once per model after a clone saved with ``buffered_signals``, with the
+# primary keys of the objects created
+objects_cloned = Signal(providing_args=['pks'])
+
+# Sent when a clone page runs more queries than ``clone_query_budget`` allows
+query_budget_exceeded = Signal(providing_args=['model_admin', 'request', 'object_id',
+                                               'queries', 'budget'])
+
+_local = threading.local()
+
+
+class buffered_signals(object):
+    '''
+    Context manager that holds back ``pre_save``, ``post_save`` and ``m2m_changed``
+    for instances of ``models`` in the current thread, and sends ``objects_cloned``
+    for each model instead, when the block exits without an exception
+    '''
+
+    def __init__(self, models):
+        self.models = frozenset(models)
+        self.created = dict((model, []) for model in self.models)
+
+    def __enter__(self):
+        install()
+        self.previous = getattr(_local, 'buffer', None)
+        _local.buffer = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _local.buffer = self.previous
+        if exc_type is None:
+            for model, pks in self.created.items():
+                if pks:
+                    # a row can be recorded twice, like by two inlines of a model
+                    seen = set()
+                    unique = []
+                    for pk in pks:
+                        if pk not in seen:
+                            seen.add(pk)
+                            unique.append(pk)
+                    objects_cloned.send(sender=model, pks=unique)
+
+    def add(self, model, pks):
+        '''
+        Records objects created without signals, like with ``bulk_create``
+        '''
+        self.created.setdefault(model, []).extend(pks)
+
+    def add_links(self, through, instance, model, pks):
+        '''
+        Records the rows of the many-to-many ``through`` table linking ``instance``
+        to the ``model`` objects ``pks``, whose ``m2m_changed`` is held back
+        '''
+        instance_model = instance._meta.concrete_model
+        related_model = model._meta.concrete_model
+        fields = [f for f in through._meta.concrete_fields if f.is_relation]
+        source = [f for f in fields if f.related_model is instance_model][0]
+        target = [f for f in fields if f.related_model is related_model and f is not source][0]
+        self.add(through, list(through._default_manager.filter(**{
+            source.name: instance,
+            target.name + '__in': pks,
+        }).values_list('pk', flat=True)))
+
+    def holds(self, signal, sender, named):
+        if signal is m2m_changed:
+            if named['instance'].__class__ not in self.models:
+                return False
+            if named.get('action') == 'post_add' and named.get('pk_set'):
+                self.add_links(sender, named['instance'], named['model'], named['pk_set'])
+            return True
+        if sender not in self.models:
+            return False
+        if signal is post_save and named.get('created'):
+            self.add(sender, [named['instance'].pk])
+        return True
+
+
+def install():
+    '''
+    Wraps ``send()`` of the signals ``buffered_signals`` holds back, once
+    '''
+    for signal in (pre_save, post_save, m2m_changed):
+        if getattr(signal, '_modelclone_send', None) is None:
+            signal._modelclone_send = signal.send
+            signal.send = _buffered_send(signal)
+
+
+def _buffered_send(signal):
+    def send(sender, **named):
+        buffer = getattr(_local, 'buffer', None)
+        if buffer is not None and buffer.holds(signal, sender, named):
+            return []
+        return signal._modelclone_send(sender, **named)
+    return send
@@ -1,8 +1,9 @@
 from django.contrib import admin
+from django.contrib.contenttypes.admin import GenericTabularInline
 
 from modelclone import ClonableModelAdmin
 
-from .models import Post, Comment, Tag, Multimedia
+from .models import Post, Comment, Tag, Multimedia, Category, Note
 
 
 class CommentInline(admin.StackedInline):
@@ -12,9 +13,14 @@ class CommentInline(admin.StackedInline):
 class MultimediaInline(admin.TabularInline):
     model = Multimedia
 
+class NoteInline(GenericTabularInline):
+    model = Note
+
 class PostAdmin(ClonableModelAdmin):
-    inlines = (CommentInline, MultimediaInline)
+    inlines = (CommentInline, MultimediaInline, NoteInline)
     clone_verbose_name = 'Clone it!'
+    # the clone page takes the same queries however many inline rows there are
+    clone_query_budget = {'GET': 10}
 
     list_display = '__unicode__', 'clone_link'
 
@@ -31,6 +37,13 @@ class PostAdmin(ClonableModelAdmin):
 class MultimediaAdmin(ClonableModelAdmin):
     pass
 
+class TagAdmin(admin.ModelAdmin):
+    search_fields = ('name',)
+
+class CategoryAdmin(ClonableModelAdmin):
+    pass
+
 admin.site.register(Post, PostAdmin)
-admin.site.register(Tag)
+admin.site.register(Tag, TagAdmin)
 admin.site.register(Multimedia, MultimediaAdmin)
+admin.site.register(Category, CategoryAdmin)
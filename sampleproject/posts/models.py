@@ -1,5 +1,9 @@
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.models import ContentType
 from django.db import models
 
+from modelclone.models import CopyOnWriteManager
+
 try:
     unicode('')
 except NameError:
@@ -22,6 +26,8 @@ class Comment(models.Model):
     author = models.CharField(max_length=256)
     content = models.TextField()
 
+    objects = CopyOnWriteManager()
+
     def __unicode__(self):
         return u'Comment on {0} by {1}'.format(self.post, self.author)
 
@@ -35,6 +41,15 @@ class Tag(models.Model):
 
     __str__ = __unicode__
 
+class Category(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    slug = models.SlugField(unique=True)
+
+    def __unicode__(self):
+        return self.name
+
+    __str__ = __unicode__
+
 class Multimedia(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE)
     title = models.CharField(max_length=256)
@@ -50,3 +65,14 @@ class Multimedia(models.Model):
         return u' '.join(msg)
 
     __str__ = __unicode__
+
+class Note(models.Model):
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    content_object = GenericForeignKey('content_type', 'object_id')
+    text = models.CharField(max_length=256)
+
+    def __unicode__(self):
+        return self.text
+
+    __str__ = __unicode__
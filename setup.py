@@ -8,6 +8,7 @@ setup(
     url = "https://github.com/RealGeeks/django-modelclone",
     packages = [
         'modelclone',
+        'modelclone.migrations',
     ],
     package_data = {
         'modelclone': ['templates/modelclone/*'],
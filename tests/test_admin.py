@@ -1,4 +1,7 @@
+import os
+import pstats
 import shutil
+import tempfile
 try:
     from urllib.parse import urlparse
 except ImportError:
@@ -8,23 +11,30 @@ import django
 from django.http import HttpResponse
 from django.contrib.auth.models import User
 from django.contrib.admin import site as default_admin_site
+from django.contrib.contenttypes.models import ContentType
 from django import VERSION
 if VERSION[0] < 2:
     from django.core.urlresolvers import reverse
 else:
     from django.urls import reverse
-from django.core.exceptions import PermissionDenied
+from django.core.exceptions import PermissionDenied, ValidationError
 from django.core.files import File
 from django.conf import settings
+from django.core.cache import cache
 from django.forms.formsets import DEFAULT_MAX_NUM
+from django.db.models.query import QuerySet
+from django.db.models.signals import m2m_changed, post_save
 
 from django_webtest import WebTest
 from webtest import Upload
 import mock
 import pytest
 
-from posts.models import Post, Comment, Tag, Multimedia
+from posts.models import Post, Comment, Tag, Multimedia, Category, Note
 from modelclone import ClonableModelAdmin
+from modelclone.admin import QueryBudgetExceeded
+from modelclone.models import CloneLineage, VirtualRelation
+from modelclone.signals import objects_cloned, query_budget_exceeded
 
 from .asserts import *
 
@@ -180,6 +190,92 @@ class ClonableModelAdminTests(WebTest):
         assert Post.objects.filter(title=self.post.title + ' (duplicate)').exists()
 
 
+    def test_clone_should_copy_deferred_fields_without_displaying_them(self):
+        post_admin = default_admin_site._registry[Post]
+        with mock.patch.object(post_admin, 'clone_defer_fields', ('content',)):
+            response = self.app.get(self.post_url, user='admin')
+            refute_input(response, name='content')
+            response.form.submit()
+
+        cloned_post = Post.objects.get(title=self.post.title + ' (duplicate)')
+
+        assert 'Practice a lot!' == cloned_post.content
+
+
+    def test_clone_should_not_copy_excluded_fields(self):
+        post_admin = default_admin_site._registry[Post]
+        with mock.patch.object(post_admin, 'clone_exclude_fields', ('content',)):
+            response = self.app.get(self.post_url, user='admin')
+            refute_input(response, name='content')
+            response.form.submit()
+
+        cloned_post = Post.objects.get(title=self.post.title + ' (duplicate)')
+
+        assert '' == cloned_post.content
+
+
+    def test_clone_should_suffix_unique_fields(self):
+        category = Category.objects.create(name='Sports', slug='sports')
+        Category.objects.create(name='Sports (2)', slug='sports-3')
+        url = reverse('admin:posts_category_clone', args=(category.id,))
+
+        response = self.app.get(url, user='admin')
+
+        assert_input(response, name='name', value='Sports (3)')
+        assert_input(response, name='slug', value='sports-2')
+
+        response.form.submit()
+
+        assert Category.objects.filter(name='Sports (3)', slug='sports-2').exists()
+
+
+    def test_clone_unique_values_should_take_one_query_per_field(self):
+        Category.objects.create(name='Sports', slug='sports')
+        Category.objects.create(name='Sports (3)', slug='sports-2')
+        category_admin = default_admin_site._registry[Category]
+
+        with self.assertNumQueries(2):
+            copies = category_admin.get_unique_clone_values(
+                {'name': 'Sports', 'slug': 'sports'}, count=3)
+
+        assert ['Sports (2)', 'Sports (4)', 'Sports (5)'] == [c['name'] for c in copies]
+        assert ['sports-3', 'sports-4', 'sports-5'] == [c['slug'] for c in copies]
+
+
+    def test_clone_unique_values_should_only_be_cut_to_fit(self):
+        category_admin = default_admin_site._registry[Category]
+        name = Category._meta.get_field('name')
+
+        with mock.patch.object(name, 'max_length', 10):
+            fits, = category_admin.get_unique_clone_values({'name': 'abc'})
+            cut = category_admin.get_unique_clone_values({'name': 'abcdefghij'}, count=2)
+        with mock.patch.object(name, 'max_length', 5):
+            tiny, = category_admin.get_unique_clone_values({'name': 'abcdef'})
+        with mock.patch.object(name, 'max_length', 3):
+            no_room, = category_admin.get_unique_clone_values({'name': 'abcdef'})
+
+        assert 'abc (2)' == fits['name']
+        assert ['abcdef (2)', 'abcdef (3)'] == [copy['name'] for copy in cut]
+        assert 'a (2)' == tiny['name']
+        assert 'name' not in no_room
+
+    def test_clone_unique_values_should_skip_taken_cut_values(self):
+        Category.objects.create(name='abcdef (2)', slug='taken')
+        category_admin = default_admin_site._registry[Category]
+
+        with mock.patch.object(Category._meta.get_field('name'), 'max_length', 10):
+            copy, = category_admin.get_unique_clone_values({'name': 'abcdefghij'})
+
+        assert 'abcdef (3)' == copy['name']
+
+    def test_clone_should_look_objects_up_with_get_object(self):
+        post_admin = default_admin_site._registry[Post]
+        with mock.patch.object(post_admin, 'get_object', return_value=None) as get_object:
+            response = self.app.get(self.post_url, user='admin', expect_errors=True)
+
+        assert 404 == response.status_code
+        assert str(self.post.id) == get_object.call_args[0][1]
+
     def test_clone_should_return_404_if_object_does_not_exist(self):
         response = self.app.get(reverse('admin:posts_post_clone', args=(999999999,)), user='admin',
                                 expect_errors=True)
@@ -290,6 +386,17 @@ class ClonableModelAdminTests(WebTest):
         assert post2.multimedia_set.first().image.name == 'images/img-2.jpg'
         assert post2.multimedia_set.first().document.name == 'documents/file-2.txt'
 
+    def test_clone_should_save_nothing_if_it_fails_halfway(self):
+        post_admin = default_admin_site._registry[Post]
+        response = self.app.get(self.post_with_comments_url, user='admin')
+
+        with mock.patch.object(post_admin, 'log_clone', side_effect=RuntimeError):
+            with pytest.raises(RuntimeError):
+                response.form.submit()
+
+        assert not Post.objects.filter(title=self.post_with_comments.title + ' (duplicate)').exists()
+        assert 2 == Comment.objects.count()
+
     def test_clone_should_ignore_initial_data_of_inline_form_if_delete_is_checked(self):
         response = self.app.get(self.post_with_comments_url, user='admin')
         response.form.set('comment_set-0-DELETE', 'on')  # delete first comment
@@ -300,6 +407,114 @@ class ClonableModelAdminTests(WebTest):
         assert 1 == cloned_post.comment_set.count()
 
 
+    def test_clone_should_not_render_streamed_inlines_on_GET(self):
+        post_admin = default_admin_site._registry[Post]
+        with mock.patch.object(post_admin, 'clone_streamed_inlines', ('comment_set',)):
+            response = self.app.get(self.post_with_comments_url, user='admin')
+
+        refute_input(response, name='comment_set-0-author')
+        refute_input(response, name='comment_set-TOTAL_FORMS')
+        assert_input(response, name='multimedia_set-TOTAL_FORMS')
+
+    def test_clone_should_copy_streamed_inlines_in_chunks_on_POST(self):
+        Comment.objects.create(author='Carol', content='Third', post=self.post_with_comments)
+        post_admin = default_admin_site._registry[Post]
+        with mock.patch.object(post_admin, 'clone_streamed_inlines', ('comment_set',)), \
+                mock.patch.object(post_admin, 'clone_chunk_size', 2):
+            response = self.app.get(self.post_with_comments_url, user='admin')
+            response.form.submit()
+
+        cloned_post = Post.objects.get(title=self.post_with_comments.title + ' (duplicate)')
+
+        assert ['Bob', 'Alice', 'Carol'] == list(
+            cloned_post.comment_set.order_by('id').values_list('author', flat=True))
+        assert 3 == self.post_with_comments.comment_set.count()
+
+
+    def test_clone_should_only_clone_inlines_asked_for(self):
+        response = self.app.get(self.post_with_comments_url + '?inlines=multimedia_set', user='admin')
+
+        refute_input(response, name='comment_set-TOTAL_FORMS')
+        assert_input(response, name='multimedia_set-TOTAL_FORMS')
+
+        response.form.submit()
+
+        cloned_post = Post.objects.get(title=self.post_with_comments.title + ' (duplicate)')
+        assert 0 == cloned_post.comment_set.count()
+
+    def test_clone_should_not_query_inlines_left_out(self):
+        post_admin = default_admin_site._registry[Post]
+        with mock.patch.object(post_admin, 'get_cloned_inline_queryset') as get_queryset:
+            self.app.get(self.post_with_comments_url + '?inlines=', user='admin')
+
+        assert not get_queryset.called
+
+    def test_clone_should_filter_inline_rows_in_queryset_hook(self):
+        post_admin = default_admin_site._registry[Post]
+        def filter_comments(request, related_name, queryset):
+            if related_name == 'comment_set':
+                queryset = queryset.exclude(author='Bob')
+            return queryset
+
+        with mock.patch.object(post_admin, 'filter_cloned_inline_queryset', filter_comments):
+            response = self.app.get(self.post_with_comments_url, user='admin')
+            assert_input(response, name='comment_set-0-author', value='Alice')
+            assert_input(response, name='comment_set-1-author', value='')
+            response.form.submit()
+
+        cloned_post = Post.objects.get(title=self.post_with_comments.title + ' (duplicate)')
+        assert ['Alice'] == list(cloned_post.comment_set.values_list('author', flat=True))
+
+    def test_clone_link_should_ask_for_clone_link_inlines(self):
+        model_admin = ClonableModelAdmin(Post, default_admin_site)
+        model_admin.clone_link_inlines = ('comment_set', 'multimedia_set')
+        expected_link = '<a href="{0}?inlines=comment_set%2Cmultimedia_set">{1}</a>'.format(
+            reverse('admin:posts_post_clone', args=(self.post.id,)),
+            model_admin.clone_verbose_name)
+
+        assert model_admin.clone_link(self.post) == expected_link
+
+
+    def test_clone_should_pre_fill_generic_inlines_on_GET(self):
+        Note.objects.create(content_object=self.post, text='Check the wind')
+        Note.objects.create(content_object=self.post_with_comments, text='Not this one')
+
+        response = self.app.get(self.post_url, user='admin')
+
+        prefix = 'posts-note-content_type-object_id'
+        assert_input(response, name=prefix + '-0-text', value='Check the wind')
+        assert_input(response, name=prefix + '-0-id', value='')
+        assert_input(response, name=prefix + '-1-text', value='')
+
+    def test_clone_should_create_generic_inlines_on_POST(self):
+        Note.objects.create(content_object=self.post, text='Check the wind')
+
+        response = self.app.get(self.post_url, user='admin')
+        response.form.submit()
+
+        cloned_post = Post.objects.get(title=self.post.title + ' (duplicate)')
+        notes = Note.objects.filter(object_id=cloned_post.id)
+        assert ['Check the wind'] == [note.text for note in notes]
+        assert cloned_post == notes[0].content_object
+
+    def test_clone_should_bulk_copy_streamed_generic_inlines(self):
+        Note.objects.create(content_object=self.post, text='First')
+        Note.objects.create(content_object=self.post, text='Second')
+        post_admin = default_admin_site._registry[Post]
+
+        with mock.patch.object(post_admin, 'clone_streamed_inlines',
+                               ('posts-note-content_type-object_id',)):
+            response = self.app.get(self.post_url, user='admin')
+            refute_input(response, name='posts-note-content_type-object_id-0-text')
+            response.form.submit()
+
+        cloned_post = Post.objects.get(title=self.post.title + ' (duplicate)')
+        assert ['First', 'Second'] == sorted(
+            note.text for note in Note.objects.filter(object_id=cloned_post.id))
+        assert all(note.content_object == cloned_post
+                   for note in Note.objects.filter(object_id=cloned_post.id))
+
+
     def test_clone_with_m2m_fields_should_prefill_m2m_fields(self):
         response = self.app.get(self.post_with_tags_url, user='admin')
 
@@ -335,6 +550,34 @@ class ClonableModelAdminTests(WebTest):
         assert tag2_option.get('selected')
 
 
+    def test_clone_with_lightweight_relations_should_only_render_selected_choices(self):
+        for i in range(20):
+            Tag.objects.create(name='tag {0}'.format(i))
+        post_admin = default_admin_site._registry[Post]
+
+        with mock.patch.object(post_admin, 'clone_lightweight_relations', True):
+            response = self.app.get(self.post_with_tags_url, user='admin')
+            select = select_element(response, 'select[name=tags]')
+            assert 'admin-autocomplete' in select.get('class')
+            assert [str(self.tag1.id)] == [option.get('value') for option in select]
+
+            response.form.submit()
+
+        cloned_post = Post.objects.get(title=self.post_with_tags.title + ' (duplicate)')
+        assert [self.tag1] == list(cloned_post.tags.all())
+
+    def test_clone_with_lightweight_relations_should_fall_back_to_raw_id_widgets(self):
+        post_admin = default_admin_site._registry[Post]
+        tag_admin = default_admin_site._registry[Tag]
+
+        with mock.patch.object(post_admin, 'clone_lightweight_relations', True), \
+                mock.patch.object(tag_admin, 'search_fields', ()):
+            response = self.app.get(self.post_with_tags_url, user='admin')
+
+        assert_input(response, name='tags', value=self.tag1.id)
+        assert not response.lxml.cssselect('select[name=tags]')
+
+
     def test_clone_save_and_continue_editing_should_redirect_to_new_object_edit_page(self):
         response = self.app.get(self.post_url, user='admin')
         response = response.form.submit('_continue')
@@ -347,6 +590,758 @@ class ClonableModelAdminTests(WebTest):
         assert reverse('admin:posts_post_change', args=(new_id,)) == loc.path
 
 
+    # clone many
+
+    def test_clone_many_should_create_copies_with_inlines_and_m2m(self):
+        self.post_with_comments.tags.add(self.tag1, self.tag2)
+        Note.objects.create(content_object=self.post_with_comments, text='Note')
+        post_admin = default_admin_site._registry[Post]
+        request = mock.Mock(user=User.objects.get(username='admin'), GET={})
+
+        new_posts = post_admin.clone_many(request, self.post_with_comments, [
+            {'title': 'Copy 1'},
+            {'title': 'Copy 2', 'content': 'Changed'},
+        ])
+
+        assert ['Copy 1', 'Copy 2'] == [post.title for post in new_posts]
+        for post in Post.objects.filter(title__startswith='Copy'):
+            assert ['Alice', 'Bob'] == sorted(post.comment_set.values_list('author', flat=True))
+            assert set([self.tag1, self.tag2]) == set(post.tags.all())
+            assert ['Note'] == [note.text for note in Note.objects.filter(object_id=post.id)]
+        assert 'Changed' == Post.objects.get(title='Copy 2').content
+        assert 'Read https://docs.djangoproject.com/' == Post.objects.get(title='Copy 1').content
+
+    def test_clone_many_should_suffix_unique_fields_of_each_copy(self):
+        category = Category.objects.create(name='Sports', slug='sports')
+        category_admin = default_admin_site._registry[Category]
+
+        request = mock.Mock(user=User.objects.get(username='admin'), GET={})
+
+        category_admin.clone_many(request, category, [{}, {}, {'slug': 'custom'}])
+
+        assert ['Sports', 'Sports (2)', 'Sports (3)', 'Sports (4)'] == list(
+            Category.objects.order_by('id').values_list('name', flat=True))
+        assert ['sports', 'sports-2', 'sports-3', 'custom'] == list(
+            Category.objects.order_by('id').values_list('slug', flat=True))
+
+    def test_clone_many_should_validate_each_copy(self):
+        Category.objects.create(name='Sports', slug='sports')
+        category = Category.objects.create(name='Surf', slug='surf')
+        category_admin = default_admin_site._registry[Category]
+        request = mock.Mock(user=User.objects.get(username='admin'), GET={})
+
+        with pytest.raises(ValidationError) as taken:
+            category_admin.clone_many(request, category, [{}, {'slug': 'sports'}])
+        with pytest.raises(ValidationError) as repeated:
+            category_admin.clone_many(request, category, [{'slug': 'wind'}, {'slug': 'wind'}])
+        with pytest.raises(ValidationError) as too_long:
+            category_admin.clone_many(request, category, [{'name': 'x' * 51}])
+
+        assert 'Row 2, field "slug"' in taken.value.messages[0]
+        assert 'Row 2, field "slug"' in repeated.value.messages[0]
+        assert 'Row 1, field "name"' in too_long.value.messages[0]
+        assert 2 == Category.objects.count()
+
+    def test_clone_many_should_not_copy_omitted_fields(self):
+        post_admin = default_admin_site._registry[Post]
+        request = mock.Mock(user=User.objects.get(username='admin'), GET={})
+
+        with mock.patch.object(post_admin, 'clone_exclude_fields', ('content',)):
+            excluded, = post_admin.clone_many(request, self.post, [{'title': 'Excluded'}])
+        with mock.patch.object(post_admin, 'clone_defer_fields', ('content',)):
+            deferred, overridden = post_admin.clone_many(request, self.post, [
+                {'title': 'Deferred'}, {'title': 'Overridden', 'content': 'New'}])
+
+        assert '' == Post.objects.get(pk=excluded.pk).content
+        assert 'Practice a lot!' == Post.objects.get(pk=deferred.pk).content
+        assert 'New' == Post.objects.get(pk=overridden.pk).content
+
+    def test_clone_many_view_should_create_copies_from_uploaded_csv(self):
+        url = reverse('admin:posts_post_clone_many', args=(self.post_with_comments.id,))
+        response = self.app.get(url, user='admin')
+        response.form['variations'] = Upload('variations.csv', b'title,content\nCSV 1,\nCSV 2,Other\n')
+        response = response.form.submit()
+
+        assert 302 == response.status_code
+        assert 'Read https://docs.djangoproject.com/' == Post.objects.get(title='CSV 1').content
+        assert 'Other' == Post.objects.get(title='CSV 2').content
+        assert 2 == Post.objects.get(title='CSV 2').comment_set.count()
+
+    def test_clone_many_view_should_read_multiline_csv_cells(self):
+        url = reverse('admin:posts_post_clone_many', args=(self.post.id,))
+        response = self.app.get(url, user='admin')
+        response.form['variations'] = Upload('variations.csv',
+                                             b'title,content\nCSV 1,"Two\nlines"\n')
+        response = response.form.submit()
+
+        assert 302 == response.status_code
+        assert 'Two\nlines' == Post.objects.get(title='CSV 1').content
+
+    def test_clone_many_view_should_display_malformed_csv_error(self):
+        url = reverse('admin:posts_post_clone_many', args=(self.post.id,))
+        response = self.app.get(url, user='admin')
+        # over the csv module's field size limit
+        response.form['variations'] = Upload('variations.csv',
+                                             b'title\n"' + b'x' * 200000 + b'"\n')
+        response = response.form.submit()
+
+        assert 200 == response.status_code
+        assert b'field larger than field limit' in response.content
+        assert 4 == Post.objects.count()
+
+    def test_clone_many_view_should_display_errors_and_create_nothing(self):
+        url = reverse('admin:posts_post_clone_many', args=(self.post.id,))
+        response = self.app.get(url, user='admin')
+        response.form['variations'] = Upload('variations.json', b'[{"title": "JSON"}, {"nope": 1}]')
+        response = response.form.submit()
+
+        assert 200 == response.status_code
+        assert b'Row 2: unknown field' in response.content
+        assert not Post.objects.filter(title='JSON').exists()
+
+
+    # read database
+
+    def _models_read_from(self, alias):
+        reads = []
+        using = QuerySet.using
+        def record_using(queryset, db):
+            if db == alias:
+                reads.append(queryset.model)
+            return using(queryset, db)
+        return reads, mock.patch.object(QuerySet, 'using', record_using)
+
+    def test_clone_page_should_read_from_clone_read_database(self):
+        self.post_with_comments.tags.add(self.tag1)
+        post_admin = default_admin_site._registry[Post]
+        reads, patch_using = self._models_read_from('default')
+        with mock.patch.object(post_admin, 'clone_read_database', 'default'), patch_using:
+            response = self.app.get(self.post_with_comments_url, user='admin')
+
+        assert set([Post, Comment, Multimedia, Tag]) <= set(reads)
+        assert_input(response, name='comment_set-0-author', value='Bob')
+
+    def test_clone_save_should_read_source_from_primary_if_asked(self):
+        post_admin = default_admin_site._registry[Post]
+        with mock.patch.object(post_admin, 'clone_read_database', 'default'):
+            response = self.app.get(self.post_with_comments_url, user='admin')
+
+        reads, patch_using = self._models_read_from('default')
+        with mock.patch.object(post_admin, 'clone_read_database', 'default'), \
+                mock.patch.object(post_admin, 'clone_read_source_from_primary', True), \
+                patch_using:
+            response.form.submit()
+
+        assert Post not in reads
+        cloned_post = Post.objects.get(title=self.post_with_comments.title + ' (duplicate)')
+        assert 2 == cloned_post.comment_set.count()
+
+
+    # idempotency
+
+    def test_clone_form_should_be_submitted_once(self):
+        response = self.app.get(self.post_with_comments_url, user='admin')
+        assert_input(response, name='_clone_token')
+
+        first = response.form.submit()
+        second = response.form.submit()
+
+        assert 1 == Post.objects.filter(title=self.post_with_comments.title + ' (duplicate)').count()
+        cloned_post = Post.objects.latest('id')
+        assert 2 == cloned_post.comment_set.count()
+        assert 302 == second.status_code
+        assert first['Location'] == second['Location']
+
+    def test_clone_form_submitted_while_first_submission_runs_should_conflict(self):
+        post_admin = default_admin_site._registry[Post]
+        response = self.app.get(self.post_url, user='admin')
+        token = response.form['_clone_token'].value
+        cache.set('modelclone:posts.post:' + token, 'pending')
+
+        with mock.patch.object(post_admin, 'clone_idempotency_wait', 0):
+            response = response.form.submit(expect_errors=True)
+
+        assert 409 == response.status_code
+        assert not Post.objects.filter(title=self.post.title + ' (duplicate)').exists()
+
+    def test_clone_form_token_should_be_released_on_validation_errors(self):
+        response = self.app.get(self.post_url, user='admin')
+        response.form['title'] = ''
+        response = response.form.submit()
+        assert b'Please correct the error below' in response.content
+
+        response.form['title'] = 'Fixed'
+        response.form.submit()
+
+        assert Post.objects.filter(title='Fixed').exists()
+
+    def test_clone_form_token_should_be_released_if_the_save_fails(self):
+        post_admin = default_admin_site._registry[Post]
+        response = self.app.get(self.post_url, user='admin')
+
+        with mock.patch.object(post_admin, 'log_clone', side_effect=RuntimeError):
+            with pytest.raises(RuntimeError):
+                response.form.submit()
+        assert not Post.objects.filter(title=self.post.title + ' (duplicate)').exists()
+
+        response.form.submit()
+        assert 1 == Post.objects.filter(title=self.post.title + ' (duplicate)').count()
+
+    def test_clone_form_token_without_value_should_be_free(self):
+        response = self.app.get(self.post_url, user='admin')
+        cache.set('modelclone:posts.post:' + response.form['_clone_token'].value, None)
+
+        response.form.submit()
+
+        assert Post.objects.filter(title=self.post.title + ' (duplicate)').exists()
+
+    def test_clone_form_should_have_no_token_if_idempotency_is_off(self):
+        post_admin = default_admin_site._registry[Post]
+        with mock.patch.object(post_admin, 'clone_idempotency_timeout', None):
+            response = self.app.get(self.post_url, user='admin')
+            refute_input(response, name='_clone_token')
+            response.form.submit()
+            response.form.submit()
+
+        assert 2 == Post.objects.filter(title=self.post.title + ' (duplicate)').count()
+
+
+    # admission control
+
+    def test_clone_should_be_busy_if_over_concurrency_limit(self):
+        post_admin = default_admin_site._registry[Post]
+        cache.set('modelclone:admission', 1)
+        try:
+            with mock.patch.object(post_admin, 'clone_max_concurrent_weight', 3):
+                response = self.app.get(self.post_with_comments_url, user='admin',
+                                        expect_errors=True)
+            assert 503 == response.status_code
+            assert '5' == response['Retry-After']
+            assert 1 == cache.get('modelclone:admission')
+        finally:
+            cache.delete('modelclone:admission')
+
+    def test_clone_form_submitted_again_should_not_need_admission(self):
+        post_admin = default_admin_site._registry[Post]
+        with mock.patch.object(post_admin, 'clone_max_concurrent_weight', 3):
+            response = self.app.get(self.post_with_comments_url, user='admin')
+            first = response.form.submit()
+            cache.set('modelclone:admission', 3)
+            try:
+                second = response.form.submit()
+            finally:
+                cache.delete('modelclone:admission')
+
+        assert 302 == second.status_code
+        assert first['Location'] == second['Location']
+        assert 1 == Post.objects.filter(title=self.post_with_comments.title + ' (duplicate)').count()
+
+    def test_clone_form_token_should_be_released_if_busy(self):
+        post_admin = default_admin_site._registry[Post]
+        with mock.patch.object(post_admin, 'clone_max_concurrent_weight', 3):
+            response = self.app.get(self.post_with_comments_url, user='admin')
+            cache.set('modelclone:admission', 3)
+            try:
+                busy = response.form.submit(expect_errors=True)
+            finally:
+                cache.delete('modelclone:admission')
+            response.form.submit()
+
+        assert 503 == busy.status_code
+        assert 1 == Post.objects.filter(title=self.post_with_comments.title + ' (duplicate)').count()
+
+    def test_clone_should_release_its_weight(self):
+        post_admin = default_admin_site._registry[Post]
+        with mock.patch.object(post_admin, 'clone_max_concurrent_weight', 3), \
+                mock.patch.object(post_admin, 'release_clone_admission',
+                                  wraps=post_admin.release_clone_admission) as release:
+            response = self.app.get(self.post_with_comments_url, user='admin')
+            response.form.submit()
+
+        # the post itself and its two comments
+        assert [mock.call(3), mock.call(3)] == release.call_args_list
+        assert 0 == cache.get('modelclone:admission')
+        assert Post.objects.filter(title=self.post_with_comments.title + ' (duplicate)').exists()
+
+    def test_clone_admission_total_should_not_expire_while_clones_start_and_finish(self):
+        post_admin = default_admin_site._registry[Post]
+        with mock.patch.object(post_admin, 'clone_max_concurrent_weight', 10), \
+                mock.patch.object(post_admin, 'clone_admission_timeout', 10):
+            with mock.patch('time.time', return_value=1000):
+                assert post_admin.acquire_clone_admission(3)
+            with mock.patch('time.time', return_value=1008):
+                assert post_admin.acquire_clone_admission(2)
+            with mock.patch('time.time', return_value=1015):
+                assert 5 == cache.get('modelclone:admission')
+                post_admin.release_clone_admission(3)
+                post_admin.release_clone_admission(2)
+                assert 0 == cache.get('modelclone:admission')
+
+    def test_clone_admission_total_should_not_go_negative_after_expiring(self):
+        post_admin = default_admin_site._registry[Post]
+        with mock.patch.object(post_admin, 'clone_max_concurrent_weight', 10):
+            assert post_admin.acquire_clone_admission(3)
+            cache.delete('modelclone:admission')
+            assert post_admin.acquire_clone_admission(1)
+            post_admin.release_clone_admission(3)
+
+        assert 0 == cache.get('modelclone:admission')
+
+    def test_clone_heavier_than_limit_should_run_alone(self):
+        post_admin = default_admin_site._registry[Post]
+        with mock.patch.object(post_admin, 'clone_max_concurrent_weight', 2):
+            response = self.app.get(self.post_with_comments_url, user='admin')
+
+        assert 200 == response.status_code
+        assert 0 == cache.get('modelclone:admission')
+
+
+    # signals
+
+    def _receive(self, signal):
+        calls = []
+        def receiver(sender, **kwargs):
+            calls.append((sender, kwargs))
+        signal.connect(receiver, weak=False)
+        self.addCleanup(signal.disconnect, receiver)
+        return calls
+
+    def test_clone_should_send_one_signal_per_model_if_buffering(self):
+        self.post_with_comments.tags.add(self.tag1)
+        post_admin = default_admin_site._registry[Post]
+        response = self.app.get(self.post_with_comments_url, user='admin')
+
+        saves = self._receive(post_save)
+        m2m_changes = self._receive(m2m_changed)
+        clones = self._receive(objects_cloned)
+        with mock.patch.object(post_admin, 'clone_buffer_signals', True):
+            response.form.submit()
+
+        cloned_post = Post.objects.get(title=self.post_with_comments.title + ' (duplicate)')
+        assert [] == [sender for sender, kwargs in saves if sender in (Post, Comment)]
+        assert [] == m2m_changes
+
+        sent = dict((sender, kwargs['pks']) for sender, kwargs in clones)
+        assert [cloned_post.pk] == sent[Post]
+        assert sorted(cloned_post.comment_set.values_list('pk', flat=True)) == sorted(sent[Comment])
+        Through = Post.tags.through
+        assert list(Through.objects.filter(post=cloned_post).values_list('pk', flat=True)) == \
+            sent[Through]
+
+        Comment.objects.create(author='Carol', content='Signals are back', post=cloned_post)
+        assert [Comment] == [sender for sender, kwargs in saves if sender in (Post, Comment)]
+
+    def _bulk_inserts_return_pks(self):
+        # like PostgreSQL does, which the test database can't
+        bulk_create = QuerySet.bulk_create
+        def bulk_create_returning_pks(queryset, objs, *args, **kwargs):
+            objs = bulk_create(queryset, objs, *args, **kwargs)
+            pks = queryset.model._default_manager.order_by('-pk').values_list('pk', flat=True)
+            for obj, pk in zip(objs, reversed(list(pks[:len(objs)]))):
+                obj.pk = pk
+            return objs
+        return mock.patch.object(QuerySet, 'bulk_create', bulk_create_returning_pks)
+
+    def test_clone_should_send_signal_for_rows_copied_in_bulk(self):
+        Note.objects.create(content_object=self.post_with_comments, text='Streamed')
+        next_post_id = Post.objects.latest('id').id + 1
+        tag = Tag.objects.create(id=next_post_id, name='same id as the clone')
+        Note.objects.create(content_object=tag, text='Same object id, other model')
+        post_admin = default_admin_site._registry[Post]
+        streamed = ('comment_set', 'posts-note-content_type-object_id')
+        response = self.app.get(self.post_with_comments_url, user='admin')
+
+        clones = self._receive(objects_cloned)
+        with mock.patch.object(post_admin, 'clone_buffer_signals', True), \
+                mock.patch.object(post_admin, 'clone_streamed_inlines', streamed):
+            response.form.submit()
+
+        cloned_post = Post.objects.get(title=self.post_with_comments.title + ' (duplicate)')
+        sent = dict((sender, kwargs['pks']) for sender, kwargs in clones)
+        assert sorted(cloned_post.comment_set.values_list('pk', flat=True)) == sorted(sent[Comment])
+        assert next_post_id == cloned_post.pk
+        assert [Note.objects.get(text='Streamed', object_id=cloned_post.pk).pk] == sent[Note]
+
+    def test_clone_should_send_signal_for_rows_copied_in_bulk_with_returned_pks(self):
+        post_admin = default_admin_site._registry[Post]
+        response = self.app.get(self.post_with_comments_url, user='admin')
+
+        clones = self._receive(objects_cloned)
+        with mock.patch.object(post_admin, 'clone_buffer_signals', True), \
+                mock.patch.object(post_admin, 'clone_streamed_inlines', ('comment_set',)), \
+                self._bulk_inserts_return_pks():
+            response.form.submit()
+
+        cloned_post = Post.objects.get(title=self.post_with_comments.title + ' (duplicate)')
+        sent = dict((sender, kwargs['pks']) for sender, kwargs in clones)
+        assert sorted(cloned_post.comment_set.values_list('pk', flat=True)) == sorted(sent[Comment])
+
+    def test_clone_many_should_send_signal_for_rows_and_links_copied_in_bulk(self):
+        self.post_with_comments.tags.add(self.tag1)
+        post_admin = default_admin_site._registry[Post]
+        request = mock.Mock(user=User.objects.get(username='admin'), GET={})
+
+        clones = self._receive(objects_cloned)
+        with mock.patch.object(post_admin, 'clone_buffer_signals', True):
+            new_post, = post_admin.clone_many(request, self.post_with_comments, [{}])
+
+        sent = dict((sender, kwargs['pks']) for sender, kwargs in clones)
+        assert sorted(new_post.comment_set.values_list('pk', flat=True)) == sorted(sent[Comment])
+        Through = Post.tags.through
+        assert list(Through.objects.filter(post=new_post).values_list('pk', flat=True)) == \
+            sent[Through]
+
+    def test_clone_should_send_per_row_signals_by_default(self):
+        response = self.app.get(self.post_with_comments_url, user='admin')
+
+        saves = self._receive(post_save)
+        clones = self._receive(objects_cloned)
+        response.form.submit()
+
+        assert 2 == len([sender for sender, kwargs in saves if sender is Comment])
+        assert [] == clones
+
+
+    # profiling
+
+    def test_clone_should_save_profiles_if_sampled(self):
+        profile_dir = tempfile.mkdtemp()
+        self.addCleanup(rm_rf, profile_dir)
+        post_admin = default_admin_site._registry[Post]
+
+        with mock.patch.object(post_admin, 'clone_profile_rate', 1), \
+                mock.patch.object(post_admin, 'clone_profile_dir', profile_dir):
+            response = self.app.get(self.post_url, user='admin')
+            response.form.submit()
+
+        names = sorted(os.listdir(profile_dir))
+        assert 2 == len(names)
+        assert names[0].startswith('posts.post-{0}-get-'.format(self.post.id))
+        assert names[1].startswith('posts.post-{0}-post-'.format(self.post.id))
+        stats = pstats.Stats(os.path.join(profile_dir, names[0]))
+        assert any(func[2] == 'clone_changeform_view' for func in stats.stats)
+
+    def test_clone_profiles_should_rotate(self):
+        profile_dir = tempfile.mkdtemp()
+        self.addCleanup(rm_rf, profile_dir)
+        post_admin = default_admin_site._registry[Post]
+
+        with mock.patch.object(post_admin, 'clone_profile_rate', 1), \
+                mock.patch.object(post_admin, 'clone_profile_dir', profile_dir), \
+                mock.patch.object(post_admin, 'clone_profile_max_bytes', 1):
+            self.app.get(self.post_url, user='admin')
+            self.app.get(self.post_with_comments_url, user='admin')
+
+        names = os.listdir(profile_dir)
+        assert 1 == len(names)
+        assert names[0].startswith('posts.post-{0}-get-'.format(self.post_with_comments.id))
+
+    def test_clone_should_not_fail_if_profiles_can_not_be_saved(self):
+        profile_dir = tempfile.mkdtemp()
+        self.addCleanup(rm_rf, profile_dir)
+        post_admin = default_admin_site._registry[Post]
+        with mock.patch.object(post_admin, 'clone_profile_rate', 1), \
+                mock.patch.object(post_admin, 'clone_profile_dir', profile_dir), \
+                mock.patch('cProfile.Profile.dump_stats', side_effect=IOError), \
+                mock.patch('modelclone.admin.logger') as logger:
+            response = self.app.get(self.post_url, user='admin')
+            response.form.submit()
+
+        assert Post.objects.filter(title=self.post.title + ' (duplicate)').exists()
+        assert 2 == logger.exception.call_count
+
+    def test_clone_should_not_profile_by_default(self):
+        with mock.patch('cProfile.Profile') as Profile:
+            self.app.get(self.post_url, user='admin')
+
+        assert not Profile.called
+
+
+    # query budget
+
+    def _clone_queries(self, model_admin):
+        counts = {}
+        def check(request, object_id, count, budget):
+            counts[request.method] = count
+        # content types are cached for the whole process, count them as cold
+        ContentType.objects.clear_cache()
+        budget = {'GET': 1000, 'POST': 1000}
+        patches = (mock.patch.object(model_admin, 'clone_query_budget', budget),
+                   mock.patch.object(model_admin, 'check_clone_query_budget', check))
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        return counts
+
+    @pytest.mark.skipif(VERSION[0] < 2, reason='needs execute_wrappers')
+    def test_clone_query_counts_of_post_admin(self):
+        self.post_with_comments.tags.add(self.tag1)
+        counts = self._clone_queries(default_admin_site._registry[Post])
+
+        response = self.app.get(self.post_with_comments_url, user='admin')
+        response.form.submit()
+
+        assert {'GET': 7, 'POST': 12} == counts
+
+    @pytest.mark.skipif(VERSION[0] < 2, reason='needs execute_wrappers')
+    def test_clone_query_counts_of_category_admin(self):
+        category = Category.objects.create(name='Sports', slug='sports')
+        counts = self._clone_queries(default_admin_site._registry[Category])
+
+        response = self.app.get(reverse('admin:posts_category_clone', args=(category.id,)),
+                                user='admin')
+        response.form.submit()
+
+        assert {'GET': 4, 'POST': 7} == counts
+
+    @pytest.mark.skipif(VERSION[0] < 2, reason='needs execute_wrappers')
+    def test_clone_over_query_budget_should_be_logged_and_sent(self):
+        post_admin = default_admin_site._registry[Post]
+        over = self._receive(query_budget_exceeded)
+
+        with mock.patch.object(post_admin, 'clone_query_budget', {'GET': 1}), \
+                mock.patch('modelclone.admin.logger') as logger:
+            response = self.app.get(self.post_url, user='admin')
+
+        assert 200 == response.status_code
+        assert 1 == len(over)
+        sender, kwargs = over[0]
+        assert Post is sender
+        assert 1 == kwargs['budget']
+        assert kwargs['queries'] > 1
+        assert 'over the budget of 1' in logger.warning.call_args[0][0]
+
+    @pytest.mark.skipif(VERSION[0] < 2, reason='needs execute_wrappers')
+    def test_clone_over_query_budget_should_raise_if_asked(self):
+        post_admin = default_admin_site._registry[Post]
+
+        with mock.patch.object(post_admin, 'clone_query_budget', {'GET': 1}), \
+                mock.patch.object(post_admin, 'clone_query_budget_raise', True):
+            with pytest.raises(QueryBudgetExceeded):
+                self.app.get(self.post_url, user='admin')
+
+
+    # cost estimate
+
+    def test_clone_estimate_should_count_rows_links_and_files(self):
+        self.post_with_multimedia.tags.add(self.tag1, self.tag2)
+        Comment.objects.create(author='Bob', content='Nice', post=self.post_with_multimedia)
+        url = reverse('admin:posts_post_clone_estimate', args=(self.post_with_multimedia.id,))
+
+        estimate = self.app.get(url, user='admin').json
+
+        assert {'comment_set': 1, 'multimedia_set': 1,
+                'posts-note-content_type-object_id': 0} == estimate['inlines']
+        assert {'tags': 2} == estimate['m2m']
+        assert 2 == estimate['files']
+        assert estimate['file_bytes'] is None
+        assert 5 == estimate['rows']
+        assert 'form' == estimate['strategy']
+
+    def test_clone_over_bulk_threshold_should_copy_inlines_on_save(self):
+        post_admin = default_admin_site._registry[Post]
+        with mock.patch.object(post_admin, 'clone_bulk_threshold', 2):
+            response = self.app.get(self.post_with_comments_url, user='admin')
+            refute_input(response, name='comment_set-TOTAL_FORMS')
+            assert_input(response, name='_clone_strategy', value='bulk')
+            response.form.submit()
+
+        cloned_post = Post.objects.get(title=self.post_with_comments.title + ' (duplicate)')
+        assert 2 == cloned_post.comment_set.count()
+
+    def test_clone_under_bulk_threshold_should_render_inlines(self):
+        post_admin = default_admin_site._registry[Post]
+        with mock.patch.object(post_admin, 'clone_bulk_threshold', 3):
+            response = self.app.get(self.post_with_comments_url, user='admin')
+
+        assert_input(response, name='comment_set-0-author', value='Bob')
+        assert_input(response, name='_clone_strategy', value='form')
+
+    def test_clone_over_deferred_threshold_should_be_saved_deferred(self):
+        post_admin = default_admin_site._registry[Post]
+        with mock.patch.object(post_admin, 'clone_deferred_threshold', 2), \
+                mock.patch.object(post_admin, 'save_deferred_clone',
+                                  wraps=post_admin.save_deferred_clone) as save_deferred_clone:
+            response = self.app.get(self.post_with_comments_url, user='admin')
+            refute_input(response, name='comment_set-TOTAL_FORMS')
+            response.form.submit()
+
+        assert save_deferred_clone.called
+        cloned_post = Post.objects.get(title=self.post_with_comments.title + ' (duplicate)')
+        assert 2 == cloned_post.comment_set.count()
+
+    def test_clone_should_be_estimated_once_per_request(self):
+        post_admin = default_admin_site._registry[Post]
+        with mock.patch.object(post_admin, 'clone_bulk_threshold', 2), \
+                mock.patch.object(post_admin, 'clone_max_concurrent_weight', 10), \
+                mock.patch.object(post_admin, 'estimate_clone_cost',
+                                  wraps=post_admin.estimate_clone_cost) as estimate_clone_cost:
+            response = self.app.get(self.post_with_comments_url, user='admin')
+            assert 1 == estimate_clone_cost.call_count
+            response.form.submit()
+            assert 2 == estimate_clone_cost.call_count
+            # a resubmitted page is answered before estimating
+            response.form.submit()
+            assert 2 == estimate_clone_cost.call_count
+
+    def test_clone_rendered_with_inlines_should_be_saved_from_the_form(self):
+        post_admin = default_admin_site._registry[Post]
+        with mock.patch.object(post_admin, 'clone_bulk_threshold', 3):
+            response = self.app.get(self.post_with_comments_url, user='admin')
+            response.form['comment_set-0-author'] = 'Robert'
+            Comment.objects.create(author='Carol', content='Third', post=self.post_with_comments)
+            response.form.submit()
+
+        cloned_post = Post.objects.get(title=self.post_with_comments.title + ' (duplicate)')
+        assert ['Robert', 'Alice'] == list(
+            cloned_post.comment_set.order_by('id').values_list('author', flat=True))
+
+
+    # lineage
+
+    def test_clone_should_record_lineage_if_enabled(self):
+        post_admin = default_admin_site._registry[Post]
+        with mock.patch.object(post_admin, 'clone_record_lineage', True):
+            response = self.app.get(self.post_url, user='admin')
+            response.form.submit()
+
+        cloned_post = Post.objects.get(title=self.post.title + ' (duplicate)')
+
+        assert [cloned_post] == [r.target for r in CloneLineage.objects.clones_of(self.post)]
+        assert [self.post] == [r.source for r in CloneLineage.objects.source_of(cloned_post)]
+
+    def test_clone_should_not_record_lineage_by_default(self):
+        response = self.app.get(self.post_url, user='admin')
+        response.form.submit()
+
+        assert not CloneLineage.objects.exists()
+
+    def test_lineage_ancestors_and_descendants(self):
+        post_admin = default_admin_site._registry[Post]
+        request = mock.Mock(user=User.objects.get(username='admin'), GET={})
+        with mock.patch.object(post_admin, 'clone_record_lineage', True):
+            child1, child2 = post_admin.clone_many(request, self.post, [{}, {}])
+            grandchild, = post_admin.clone_many(request, child2, [{}])
+
+        with self.assertNumQueries(3):
+            ancestors = CloneLineage.objects.ancestors(grandchild)
+        assert [str(child2.pk), str(self.post.pk)] == [r.source_object_id for r in ancestors]
+
+        with self.assertNumQueries(3) as queries:
+            descendants = CloneLineage.objects.descendants(self.post)
+        # each generation selects its sources from the previous ones in the database
+        assert 3 == queries.captured_queries[-1]['sql'].count('SELECT')
+        assert [str(child1.pk), str(child2.pk), str(grandchild.pk)] == sorted(
+            [r.target_object_id for r in descendants], key=int)
+
+        assert 2 == len(CloneLineage.objects.descendants(self.post, max_depth=1))
+
+
+    # virtual inlines
+
+    def _virtual_clone(self, post):
+        url = reverse('admin:posts_post_clone', args=(post.id,))
+        response = self.app.get(url, user='admin')
+        refute_input(response, name='comment_set-0-author')
+        response.form['title'] = 'Virtual {0}'.format(post.id)
+        response.form.submit()
+        return Post.objects.get(title='Virtual {0}'.format(post.id))
+
+    def test_clone_should_share_virtual_inline_rows_with_original(self):
+        post_admin = default_admin_site._registry[Post]
+        with mock.patch.object(post_admin, 'clone_virtual_inlines', ('comment_set',)):
+            cloned_post = self._virtual_clone(self.post_with_comments)
+
+        assert 0 == cloned_post.comment_set.count()
+        assert ['Alice', 'Bob'] == sorted(
+            Comment.objects.of(cloned_post, 'post').values_list('author', flat=True))
+        assert 1 == VirtualRelation.objects.of(cloned_post).count()
+
+    def test_viewing_virtual_clone_should_show_shared_rows_without_copying_them(self):
+        post_admin = default_admin_site._registry[Post]
+        with mock.patch.object(post_admin, 'clone_virtual_inlines', ('comment_set',)):
+            cloned_post = self._virtual_clone(self.post_with_comments)
+            url = reverse('admin:posts_post_change', args=(cloned_post.id,))
+            response = self.app.get(url, user='admin')
+
+        assert_input(response, name='comment_set-0-author', value='Bob')
+        assert_input(response, name='comment_set-1-author', value='Alice')
+        assert 0 == cloned_post.comment_set.count()
+        assert VirtualRelation.objects.of(cloned_post).exists()
+
+    def test_editing_virtual_clone_should_materialize_its_rows(self):
+        post_admin = default_admin_site._registry[Post]
+        with mock.patch.object(post_admin, 'clone_virtual_inlines', ('comment_set',)):
+            cloned_post = self._virtual_clone(self.post_with_comments)
+            url = reverse('admin:posts_post_change', args=(cloned_post.id,))
+            response = self.app.get(url, user='admin')
+            response.form['comment_set-0-author'] = 'Robert'
+            response.form.submit()
+
+        assert ['Alice', 'Robert'] == sorted(cloned_post.comment_set.values_list('author', flat=True))
+        assert not VirtualRelation.objects.exists()
+        assert ['Alice', 'Bob'] == sorted(
+            self.post_with_comments.comment_set.values_list('author', flat=True))
+
+    def test_editing_original_should_materialize_its_virtual_clones(self):
+        post_admin = default_admin_site._registry[Post]
+        with mock.patch.object(post_admin, 'clone_virtual_inlines', ('comment_set',)):
+            cloned_post = self._virtual_clone(self.post_with_comments)
+            url = reverse('admin:posts_post_change', args=(self.post_with_comments.id,))
+            response = self.app.get(url, user='admin')
+            assert VirtualRelation.objects.exists()
+
+            response.form['comment_set-0-DELETE'] = True
+            response.form.submit()
+
+        assert 1 == self.post_with_comments.comment_set.count()
+        assert ['Alice', 'Bob'] == sorted(cloned_post.comment_set.values_list('author', flat=True))
+        assert not VirtualRelation.objects.exists()
+
+    def test_virtual_clone_should_not_be_materialized_without_change_permission(self):
+        User.objects.create_user(username='staff', password='staff', is_staff=True)
+        post_admin = default_admin_site._registry[Post]
+        with mock.patch.object(post_admin, 'clone_virtual_inlines', ('comment_set',)):
+            cloned_post = self._virtual_clone(self.post_with_comments)
+            url = reverse('admin:posts_post_change', args=(cloned_post.id,))
+            response = self.app.get(url, user='staff', expect_errors=True)
+
+        assert 403 == response.status_code
+        assert 0 == cloned_post.comment_set.count()
+        assert VirtualRelation.objects.of(cloned_post).exists()
+
+    def test_deleting_original_anyhow_should_materialize_its_virtual_clones(self):
+        post_admin = default_admin_site._registry[Post]
+        with mock.patch.object(post_admin, 'clone_virtual_inlines', ('comment_set',)):
+            cloned_post = self._virtual_clone(self.post_with_comments)
+
+        Post.objects.filter(pk=self.post_with_comments.pk).delete()
+
+        assert ['Alice', 'Bob'] == sorted(cloned_post.comment_set.values_list('author', flat=True))
+        assert not VirtualRelation.objects.exists()
+
+    def test_deleting_virtual_clone_should_forget_its_virtual_relations(self):
+        post_admin = default_admin_site._registry[Post]
+        with mock.patch.object(post_admin, 'clone_virtual_inlines', ('comment_set',)):
+            cloned_post = self._virtual_clone(self.post_with_comments)
+            url = reverse('admin:posts_post_delete', args=(cloned_post.id,))
+            self.app.get(url, user='admin').form.submit()
+
+        assert not Post.objects.filter(pk=cloned_post.pk).exists()
+        assert not VirtualRelation.objects.exists()
+        assert 2 == self.post_with_comments.comment_set.count()
+
+    def test_virtual_clone_of_virtual_clone_should_share_original_rows(self):
+        post_admin = default_admin_site._registry[Post]
+        with mock.patch.object(post_admin, 'clone_virtual_inlines', ('comment_set',)):
+            cloned_post = self._virtual_clone(self.post_with_comments)
+            cloned_again = self._virtual_clone(cloned_post)
+
+        relation = VirtualRelation.objects.of(cloned_again).get()
+        assert str(self.post_with_comments.id) == relation.source_object_id
+        assert 2 == Comment.objects.of(cloned_again, 'post').count()
+
+
     # clone with images and files
 
     def test_clone_should_keep_file_path_from_original_object(self):